@@ -1,5 +1,22 @@
 import re
 import os
+import io
+import sys
+import json
+import mmap
+import time
+import hashlib
+import tempfile
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+
+# 本模块可以作为库导入 (GUI、反汇编器、批处理工具共用同一套指令表)：
+# 导入时只定义常量表和函数，正则表达式、解码表等派生数据在第一次使用时才构建，
+# 多进程相关的模块也只在真正并行汇编时才导入。
+
+# 汇编器版本号；编码逻辑变化时递增，使磁盘缓存中的旧结果失效
+ASSEMBLER_VERSION = '1.3.0'
 
 # 寄存器名称到编号的映射表
 REGISTER_MAP = {
@@ -40,70 +57,75 @@ REGISTER_MAP = {
 # 指令信息库
 INSTRUCTION_MAP = {
     # R-type
-    'add':    {'type': 'R', 'opcode': '0110011', 'funct3': '000', 'funct7': '0000000'},
-    'sub':    {'type': 'R', 'opcode': '0110011', 'funct3': '000', 'funct7': '0100000'},
-    'sll':    {'type': 'R', 'opcode': '0110011', 'funct3': '001', 'funct7': '0000000'},
-    'slt':    {'type': 'R', 'opcode': '0110011', 'funct3': '010', 'funct7': '0000000'},
-    'sltu':   {'type': 'R', 'opcode': '0110011', 'funct3': '011', 'funct7': '0000000'},
-    'xor':    {'type': 'R', 'opcode': '0110011', 'funct3': '100', 'funct7': '0000000'},
-    'srl':    {'type': 'R', 'opcode': '0110011', 'funct3': '101', 'funct7': '0000000'},
-    'sra':    {'type': 'R', 'opcode': '0110011', 'funct3': '101', 'funct7': '0100000'},
-    'or':     {'type': 'R', 'opcode': '0110011', 'funct3': '110', 'funct7': '0000000'},
-    'and':    {'type': 'R', 'opcode': '0110011', 'funct3': '111', 'funct7': '0000000'},
+    'add':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b000, 'funct7': 0b0000000},
+    'sub':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b000, 'funct7': 0b0100000},
+    'sll':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b001, 'funct7': 0b0000000},
+    'slt':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b010, 'funct7': 0b0000000},
+    'sltu':   {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b011, 'funct7': 0b0000000},
+    'xor':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b100, 'funct7': 0b0000000},
+    'srl':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b101, 'funct7': 0b0000000},
+    'sra':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b101, 'funct7': 0b0100000},
+    'or':     {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b110, 'funct7': 0b0000000},
+    'and':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b111, 'funct7': 0b0000000},
     # R-type (RV32M Extension)
-    'mul':    {'type': 'R', 'opcode': '0110011', 'funct3': '000', 'funct7': '0000001'},
-    'mulh':   {'type': 'R', 'opcode': '0110011', 'funct3': '001', 'funct7': '0000001'},
-    'mulhsu': {'type': 'R', 'opcode': '0110011', 'funct3': '010', 'funct7': '0000001'},
-    'mulhu':  {'type': 'R', 'opcode': '0110011', 'funct3': '011', 'funct7': '0000001'},
-    'div':    {'type': 'R', 'opcode': '0110011', 'funct3': '100', 'funct7': '0000001'},
-    'divu':   {'type': 'R', 'opcode': '0110011', 'funct3': '101', 'funct7': '0000001'},
-    'rem':    {'type': 'R', 'opcode': '0110011', 'funct3': '110', 'funct7': '0000001'},
-    'remu':   {'type': 'R', 'opcode': '0110011', 'funct3': '111', 'funct7': '0000001'},
+    'mul':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b000, 'funct7': 0b0000001},
+    'mulh':   {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b001, 'funct7': 0b0000001},
+    'mulhsu': {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b010, 'funct7': 0b0000001},
+    'mulhu':  {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b011, 'funct7': 0b0000001},
+    'div':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b100, 'funct7': 0b0000001},
+    'divu':   {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b101, 'funct7': 0b0000001},
+    'rem':    {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b110, 'funct7': 0b0000001},
+    'remu':   {'type': 'R', 'opcode': 0b0110011, 'funct3': 0b111, 'funct7': 0b0000001},
     # I-type
-    'addi':   {'type': 'I', 'opcode': '0010011', 'funct3': '000'},
-    'slti':   {'type': 'I', 'opcode': '0010011', 'funct3': '010'},
-    'sltiu':  {'type': 'I', 'opcode': '0010011', 'funct3': '011'},
-    'xori':   {'type': 'I', 'opcode': '0010011', 'funct3': '100'},
-    'ori':    {'type': 'I', 'opcode': '0010011', 'funct3': '110'},
-    'andi':   {'type': 'I', 'opcode': '0010011', 'funct3': '111'},
-    'slli':   {'type': 'I-shift', 'opcode': '0010011', 'funct3': '001', 'funct7': '0000000'},
-    'srli':   {'type': 'I-shift', 'opcode': '0010011', 'funct3': '101', 'funct7': '0000000'},
-    'srai':   {'type': 'I-shift', 'opcode': '0010011', 'funct3': '101', 'funct7': '0100000'},
-    'lb':     {'type': 'I-load', 'opcode': '0000011', 'funct3': '000'},
-    'lh':     {'type': 'I-load', 'opcode': '0000011', 'funct3': '001'},
-    'lw':     {'type': 'I-load', 'opcode': '0000011', 'funct3': '010'},
-    'lbu':    {'type': 'I-load', 'opcode': '0000011', 'funct3': '100'},
-    'lhu':    {'type': 'I-load', 'opcode': '0000011', 'funct3': '101'},
-    'jalr':   {'type': 'I', 'opcode': '1100111', 'funct3': '000'},
+    'addi':   {'type': 'I', 'opcode': 0b0010011, 'funct3': 0b000},
+    'slti':   {'type': 'I', 'opcode': 0b0010011, 'funct3': 0b010},
+    'sltiu':  {'type': 'I', 'opcode': 0b0010011, 'funct3': 0b011},
+    'xori':   {'type': 'I', 'opcode': 0b0010011, 'funct3': 0b100},
+    'ori':    {'type': 'I', 'opcode': 0b0010011, 'funct3': 0b110},
+    'andi':   {'type': 'I', 'opcode': 0b0010011, 'funct3': 0b111},
+    'slli':   {'type': 'I-shift', 'opcode': 0b0010011, 'funct3': 0b001, 'funct7': 0b0000000},
+    'srli':   {'type': 'I-shift', 'opcode': 0b0010011, 'funct3': 0b101, 'funct7': 0b0000000},
+    'srai':   {'type': 'I-shift', 'opcode': 0b0010011, 'funct3': 0b101, 'funct7': 0b0100000},
+    'lb':     {'type': 'I-load', 'opcode': 0b0000011, 'funct3': 0b000},
+    'lh':     {'type': 'I-load', 'opcode': 0b0000011, 'funct3': 0b001},
+    'lw':     {'type': 'I-load', 'opcode': 0b0000011, 'funct3': 0b010},
+    'lbu':    {'type': 'I-load', 'opcode': 0b0000011, 'funct3': 0b100},
+    'lhu':    {'type': 'I-load', 'opcode': 0b0000011, 'funct3': 0b101},
+    'jalr':   {'type': 'I-jalr', 'opcode': 0b1100111, 'funct3': 0b000},
     # S-type
-    'sb':     {'type': 'S', 'opcode': '0100011', 'funct3': '000'},
-    'sh':     {'type': 'S', 'opcode': '0100011', 'funct3': '001'},
-    'sw':     {'type': 'S', 'opcode': '0100011', 'funct3': '010'},
+    'sb':     {'type': 'S', 'opcode': 0b0100011, 'funct3': 0b000},
+    'sh':     {'type': 'S', 'opcode': 0b0100011, 'funct3': 0b001},
+    'sw':     {'type': 'S', 'opcode': 0b0100011, 'funct3': 0b010},
     # B-type
-    'beq':    {'type': 'B', 'opcode': '1100011', 'funct3': '000'},
-    'bne':    {'type': 'B', 'opcode': '1100011', 'funct3': '001'},
-    'blt':    {'type': 'B', 'opcode': '1100011', 'funct3': '100'},
-    'bge':    {'type': 'B', 'opcode': '1100011', 'funct3': '101'},
-    'bltu':   {'type': 'B', 'opcode': '1100011', 'funct3': '110'},
-    'bgeu':   {'type': 'B', 'opcode': '1100011', 'funct3': '111'},
+    'beq':    {'type': 'B', 'opcode': 0b1100011, 'funct3': 0b000},
+    'bne':    {'type': 'B', 'opcode': 0b1100011, 'funct3': 0b001},
+    'blt':    {'type': 'B', 'opcode': 0b1100011, 'funct3': 0b100},
+    'bge':    {'type': 'B', 'opcode': 0b1100011, 'funct3': 0b101},
+    'bltu':   {'type': 'B', 'opcode': 0b1100011, 'funct3': 0b110},
+    'bgeu':   {'type': 'B', 'opcode': 0b1100011, 'funct3': 0b111},
     # U-type
-    'lui':    {'type': 'U', 'opcode': '0110111'},
-    'auipc':  {'type': 'U', 'opcode': '0010111'},
+    'lui':    {'type': 'U', 'opcode': 0b0110111},
+    'auipc':  {'type': 'U', 'opcode': 0b0010111},
     # J-type
-    'jal':    {'type': 'J', 'opcode': '1101111'},
+    'jal':    {'type': 'J', 'opcode': 0b1101111},
 }
 
-# 将一个十进制数转换为指定位数的二进制补码字符串
-def to_signed_binary(num, bits):
-    if num >= 0:
-        # format(value, '0_width_b')
-        return format(num, f'0{bits}b')
-    else:
-        # Two's complement for negative numbers
-        return format((1 << bits) + num, f'0{bits}b')
+# 预先计算每条指令的固定比特位 (opcode | funct3 | funct7)
+# 编码时只需把寄存器和立即数字段移位后按位或上去，直接得到 32 位整数机器码
+for _info in INSTRUCTION_MAP.values():
+    _info['match'] = _info['opcode'] | (_info.get('funct3', 0) << 12) | (_info.get('funct7', 0) << 25)
+
+# 将一个十进制数截断为指定位数的二进制补码 (以无符号整数表示)
+def to_signed_field(num, bits):
+    return num & ((1 << bits) - 1)
+
+# 仅在最终输出阶段才把 32 位机器码转换为 '0'/'1' 字符串
+def to_binary_string(word):
+    return format(word, '032b')
 
 
 # 各类型指令处理器
+# 每个处理器返回 (32位整数机器码, None) 或 (None, 错误信息)
 def get_reg_num(reg_name):
     # 通过名称查找寄存器编号
     return REGISTER_MAP.get(reg_name.lower())
@@ -111,70 +133,72 @@ def get_reg_num(reg_name):
 def handle_r_type(instr, operands):
     rd_name, rs1_name, rs2_name = operands[0], operands[1], operands[2]
 
-    rd_num = get_reg_num(rd_name)
-    if rd_num is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+    rd = get_reg_num(rd_name)
+    if rd is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
 
-    rs1_num = get_reg_num(rs1_name)
-    if rs1_num is None: return None, f"无效的源寄存器 (rs1): '{rs1_name}'"
+    rs1 = get_reg_num(rs1_name)
+    if rs1 is None: return None, f"无效的源寄存器 (rs1): '{rs1_name}'"
 
-    rs2_num = get_reg_num(rs2_name)
-    if rs2_num is None: return None, f"无效的源寄存器 (rs2): '{rs2_name}'"
+    rs2 = get_reg_num(rs2_name)
+    if rs2 is None: return None, f"无效的源寄存器 (rs2): '{rs2_name}'"
 
-    rd, rs1, rs2 = format(rd_num, '05b'), format(rs1_num, '05b'), format(rs2_num, '05b')
-    return instr['funct7'] + rs2 + rs1 + instr['funct3'] + rd + instr['opcode'], None
+    return instr['match'] | (rs2 << 20) | (rs1 << 15) | (rd << 7), None
 
 def handle_i_type(instr, operands):
     rd_name, rs1_name = operands[0], operands[1]
 
-    rd_num = get_reg_num(rd_name)
-    if rd_num is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+    rd = get_reg_num(rd_name)
+    if rd is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+
+    rs1 = get_reg_num(rs1_name)
+    if rs1 is None: return None, f"无效的源寄存器 (rs1): '{rs1_name}'"
 
-    rs1_num = get_reg_num(rs1_name)
-    if rs1_num is None: return None, f"无效的源寄存器 (rs1): '{rs1_name}'"
+    imm = to_signed_field(int(operands[2], 0), 12)
+    return instr['match'] | (imm << 20) | (rs1 << 15) | (rd << 7), None
 
-    rd, rs1 = format(rd_num, '05b'), format(rs1_num, '05b')
-    imm = to_signed_binary(int(operands[2], 0), 12)
-    return imm + rs1 + instr['funct3'] + rd + instr['opcode'], None
+def handle_i_jalr_type(instr, operands):
+    # jalr 同时支持 'rd, rs1, imm' 与 'rd, imm(rs1)' 两种写法
+    rd_name, rs1_a, imm_a, imm_b, rs1_b = operands
+    if rs1_a is not None:
+        return handle_i_type(instr, [rd_name, rs1_a, imm_a])
+    return handle_i_type(instr, [rd_name, rs1_b, imm_b])
 
 def handle_i_shift_type(instr, operands):
     rd_name, rs1_name = operands[0], operands[1]
 
-    rd_num = get_reg_num(rd_name)
-    if rd_num is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+    rd = get_reg_num(rd_name)
+    if rd is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
 
-    rs1_num = get_reg_num(rs1_name)
-    if rs1_num is None: return None, f"无效的源寄存器 (rs1): '{rs1_name}'"
+    rs1 = get_reg_num(rs1_name)
+    if rs1 is None: return None, f"无效的源寄存器 (rs1): '{rs1_name}'"
 
-    rd, rs1 = format(rd_num, '05b'), format(rs1_num, '05b')
-    shamt = format(int(operands[2], 0), '05b')
-    return instr['funct7'] + shamt + rs1 + instr['funct3'] + rd + instr['opcode'], None
+    shamt = int(operands[2], 0) & 0x1F
+    return instr['match'] | (shamt << 20) | (rs1 << 15) | (rd << 7), None
 
 def handle_i_load_type(instr, operands):
     rd_name, rs1_name = operands[0], operands[2]
 
-    rd_num = get_reg_num(rd_name)
-    if rd_num is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+    rd = get_reg_num(rd_name)
+    if rd is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
 
-    rs1_num = get_reg_num(rs1_name)
-    if rs1_num is None: return None, f"无效的基址寄存器 (rs1): '{rs1_name}'"
+    rs1 = get_reg_num(rs1_name)
+    if rs1 is None: return None, f"无效的基址寄存器 (rs1): '{rs1_name}'"
 
-    rd, rs1 = format(rd_num, '05b'), format(rs1_num, '05b')
-    imm = to_signed_binary(int(operands[1], 0), 12)
-    return imm + rs1 + instr['funct3'] + rd + instr['opcode'], None
+    imm = to_signed_field(int(operands[1], 0), 12)
+    return instr['match'] | (imm << 20) | (rs1 << 15) | (rd << 7), None
 
 def handle_s_type(instr, operands):
     rs2_name, rs1_name = operands[0], operands[2]
 
-    rs2_num = get_reg_num(rs2_name)
-    if rs2_num is None: return None, f"无效的源寄存器 (rs2): '{rs2_name}'"
+    rs2 = get_reg_num(rs2_name)
+    if rs2 is None: return None, f"无效的源寄存器 (rs2): '{rs2_name}'"
 
-    rs1_num = get_reg_num(rs1_name)
-    if rs1_num is None: return None, f"无效的基址寄存器 (rs1): '{rs1_name}'"
+    rs1 = get_reg_num(rs1_name)
+    if rs1 is None: return None, f"无效的基址寄存器 (rs1): '{rs1_name}'"
 
-    rs2, rs1 = format(rs2_num, '05b'), format(rs1_num, '05b')
-    imm = to_signed_binary(int(operands[1], 0), 12)
-    imm11_5, imm4_0 = imm[0:7], imm[7:12]
-    return imm11_5 + rs2 + rs1 + instr['funct3'] + imm4_0 + instr['opcode'], None
+    imm = to_signed_field(int(operands[1], 0), 12)
+    imm11_5, imm4_0 = imm >> 5, imm & 0x1F
+    return instr['match'] | (imm11_5 << 25) | (rs2 << 20) | (rs1 << 15) | (imm4_0 << 7), None
 
 
 def handle_b_type(instr, operands):
@@ -183,196 +207,1030 @@ def handle_b_type(instr, operands):
     if instr.get('swap_operands', False):
         op1_name, op2_name = op2_name, op1_name
 
-    rs1_num = get_reg_num(op1_name)
-    if rs1_num is None: return None, f"无效的源寄存器 (rs1): '{op1_name}'"
+    rs1 = get_reg_num(op1_name)
+    if rs1 is None: return None, f"无效的源寄存器 (rs1): '{op1_name}'"
 
-    rs2_num = get_reg_num(op2_name)
-    if rs2_num is None: return None, f"无效的源寄存器 (rs2): '{op2_name}'"
+    rs2 = get_reg_num(op2_name)
+    if rs2 is None: return None, f"无效的源寄存器 (rs2): '{op2_name}'"
 
-    rs1, rs2 = format(rs1_num, '05b'), format(rs2_num, '05b')
     imm_val = int(operands[2], 0)
+    if imm_val % 2 != 0:
+        return None, f"B类型偏移量必须是2的倍数: {imm_val}"
+
     imm12 = (imm_val >> 12) & 1; imm11 = (imm_val >> 11) & 1
     imm10_5 = (imm_val >> 5) & 0b111111; imm4_1 = (imm_val >> 1) & 0b1111
-    imm12_bin, imm11_bin = format(imm12, '01b'), format(imm11, '01b')
-    imm10_5_bin, imm4_1_bin = format(imm10_5, '06b'), format(imm4_1, '04b')
-    return imm12_bin + imm10_5_bin + rs2 + rs1 + instr['funct3'] + imm4_1_bin + imm11_bin + instr['opcode'], None
+    return (instr['match'] | (imm12 << 31) | (imm10_5 << 25) | (rs2 << 20) | (rs1 << 15)
+            | (imm4_1 << 8) | (imm11 << 7)), None
 
 
 def handle_u_type(instr, operands):
     rd_name = operands[0]
 
-    rd_num = get_reg_num(rd_name)
-    if rd_num is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+    rd = get_reg_num(rd_name)
+    if rd is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
 
-    rd = format(rd_num, '05b')
-    imm = to_signed_binary(int(operands[1], 0), 20)
-    return imm + rd + instr['opcode'], None
+    imm = to_signed_field(int(operands[1], 0), 20)
+    return instr['match'] | (imm << 12) | (rd << 7), None
 
 def handle_j_type(instr, operands):
     rd_name = operands[0]
 
-    rd_num = get_reg_num(rd_name)
-    if rd_num is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
+    rd = get_reg_num(rd_name)
+    if rd is None: return None, f"无效的目标寄存器 (rd): '{rd_name}'"
 
-    rd = format(rd_num, '05b')
     imm_val = int(operands[1], 0)
+    if imm_val % 2 != 0:
+        return None, f"J类型偏移量必须是2的倍数: {imm_val}"
 
     imm20 = (imm_val >> 20) & 1
     imm19_12 = (imm_val >> 12) & 0xff
     imm11 = (imm_val >> 11) & 1
     imm10_1 = (imm_val >> 1) & 0x3ff
 
-    imm20_bin = format(imm20, '01b')
-    imm19_12_bin = format(imm19_12, '08b')
-    imm11_bin = format(imm11, '01b')
-    imm10_1_bin = format(imm10_1, '010b')
+    return (instr['match'] | (imm20 << 31) | (imm10_1 << 21) | (imm11 << 20)
+            | (imm19_12 << 12) | (rd << 7)), None
+
+
+# ==============================================================================
+# 操作数语法表 (第一次使用时编译，按 INSTRUCTION_MAP 中的指令类型直接查表)
+# ==============================================================================
+_REG = r'([a-zA-Z0-9]+)'
+_IMM = r'(-?0x[0-9a-fA-F]+|-?\d+)'                  # 允许十六进制和十进制
+_TARGET = r'(-?0x[0-9a-fA-F]+|-?\d+|[a-zA-Z_]\w*)'  # 立即数偏移量或标签
+
+@lru_cache(maxsize=None)
+def operand_patterns():
+    rrr = re.compile(rf'{_REG},\s*{_REG},\s*{_REG}')
+    rri = re.compile(rf'{_REG},\s*{_REG},\s*{_IMM}')
+    rrt = re.compile(rf'{_REG},\s*{_REG},\s*{_TARGET}')
+    rir = re.compile(rf'{_REG},\s*{_IMM}\({_REG}\)')
+    ri = re.compile(rf'{_REG},\s*{_IMM}')
+    rt = re.compile(rf'{_REG},\s*{_TARGET}')
+    jalr = re.compile(rf'{_REG},\s*(?:{_REG},\s*{_IMM}|{_IMM}\({_REG}\))')
+    return {
+        'R': rrr, 'I': rri, 'I-shift': rri, 'I-load': rir, 'I-jalr': jalr,
+        'S': rir, 'B': rrt, 'U': ri, 'J': rt,
+    }
+
+@lru_cache(maxsize=None)
+def _label_def_re():
+    return re.compile(r'\s*([a-zA-Z_]\w*):\s*(.*)')
+
+HANDLER_MAP = {
+    'R': handle_r_type, 'I': handle_i_type, 'I-shift': handle_i_shift_type,
+    'I-load': handle_i_load_type, 'I-jalr': handle_i_jalr_type, 'S': handle_s_type,
+    'B': handle_b_type, 'U': handle_u_type, 'J': handle_j_type,
+}
+
+@lru_cache(maxsize=None)
+def decode_table():
+    """(opcode, funct3, funct7) -> (助记符, 指令信息)；不含的字段为 None。供反汇编器和模拟器共用"""
+    table = {}
+    for mnemonic, info in INSTRUCTION_MAP.items():
+        table[(info['opcode'], info.get('funct3'), info.get('funct7'))] = (mnemonic, info)
+    return table
 
-    return imm20_bin + imm10_1_bin + imm11_bin + imm19_12_bin + rd + instr['opcode'], None
+def lookup_instruction(word):
+    """按 32 位机器码查找指令，返回 (助记符, 指令信息) 或 None"""
+    table = decode_table()
+    opcode, funct3, funct7 = word & 0x7F, (word >> 12) & 0x7, word >> 25
+    return (table.get((opcode, funct3, funct7)) or table.get((opcode, funct3, None))
+            or table.get((opcode, None, None)))
 
 
 def clean_line(line):
     return line.split('#')[0].split('//')[0].strip()
 
+def tokenize_line(line):
+    """把一行源代码拆成 (小写标签或None, 去掉标签后的指令文本)"""
+    cleaned = clean_line(line)
+    if ':' in cleaned:
+        label_match = _label_def_re().match(cleaned)
+        if label_match:
+            return label_match.group(1).lower(), label_match.group(2).strip()
+    return None, cleaned
+
+def parse_instruction(text):
+    """
+    解析一条 (已去掉标签的) 指令。
+    返回 (指令信息, 操作数列表, None) 或 (None, None, 错误信息)
+    """
+    fields = text.split()
+    mnemonic_lower = fields[0].lower()
+    instr_info = INSTRUCTION_MAP.get(mnemonic_lower)
+    if instr_info is None:
+        return None, None, f"未知指令 '{mnemonic_lower}'"
+
+    line_to_parse = ' '.join(fields[1:])
+    match = operand_patterns()[instr_info['type']].fullmatch(line_to_parse.lower())
+    if match is None:
+        return None, None, f"无法解析的操作数格式 '{line_to_parse}'"
+    return instr_info, list(match.groups()), None
+
+def encode_instruction(instr_info, operands, offset=None):
+    """调用对应类型的处理器编码；B/J 指令的跳转偏移量由 offset 给出"""
+    if offset is not None:
+        operands[-1] = str(offset)
+    return HANDLER_MAP[instr_info['type']](instr_info, operands)
+
+def _define_label(symbol_table, label_lines, label, address, line_num, errors):
+    """
+    在符号表中定义标签。重复定义时保留第一次的地址并追加一条错误，
+    各种汇编模式 (两遍、单遍、增量、并行) 因此对同一份源代码给出相同的结果和错误
+    """
+    if label in symbol_table:
+        errors.append(f"第 {line_num} 行: 重复定义的标签 '{label}' (第 {label_lines[label]} 行已定义)")
+    else:
+        symbol_table[label] = address
+        label_lines[label] = line_num
+
 def first_pass(lines):
-    symbol_table = {}
+    """扫描标签地址，返回 (符号表, 重复定义标签的错误列表)"""
+    symbol_table, label_lines, errors = {}, {}, []
     address = 0
-    for line in lines:
-        cleaned = clean_line(line)
-        if not cleaned: continue
-        label_match = re.match(r'^\s*([a-zA-Z_]\w*):\s*$', cleaned)
-        label_with_instr_match = re.match(r'^\s*([a-zA-Z_]\w*):\s*(.*)', cleaned)
-        if label_match:
-            symbol_table[label_match.group(1).lower()] = address
-        elif label_with_instr_match:
-            label = label_with_instr_match.group(1).lower()
-            instr = label_with_instr_match.group(2).strip()
-            symbol_table[label] = address
-            if instr: address += 4
-        else: address += 4
-    return symbol_table, None
-
-def second_pass(lines, symbol_table):
+    for line_num, line in enumerate(lines, 1):
+        label, text = tokenize_line(line)
+        if label is not None:
+            _define_label(symbol_table, label_lines, label, address, line_num, errors)
+        if text: address += 4
+    return symbol_table, errors
+
+def second_pass(lines, symbol_table, start_address=0, start_line=1, source_line_map=None):
+    # start_address / start_line 用于并行汇编时只处理源代码的一个分块
+    # 传入 source_line_map 列表时，依次追加 (机器码索引, 源代码行号)
     machine_codes = []
-    address = 0
+    address = start_address
     errors = []
-    for line_num, line in enumerate(lines, 1):
-        cleaned = clean_line(line)
-        if ':' in cleaned:
-            cleaned = re.sub(r'^\s*[a-zA-Z_]\w*:\s*', '', cleaned).strip()
+    for line_num, line in enumerate(lines, start_line):
+        _, cleaned = tokenize_line(line)
         if not cleaned: continue
-        try:
-            mnemonic_lower = cleaned.split()[0].lower()
-            if mnemonic_lower not in INSTRUCTION_MAP:
-                errors.append(f"第 {line_num} 行: 未知指令 '{mnemonic_lower}'")
-                address += 4
-                continue
-        except IndexError:
+
+        instr_info, operands, err = parse_instruction(cleaned)
+        if err:
+            errors.append(f"第 {line_num} 行: {err}")
             address += 4
             continue
 
-        instr_info = INSTRUCTION_MAP[mnemonic_lower]
-        instr_type = instr_info['type']
-
-        reg = r'([a-zA-Z0-9]+)'
-        imm = r'(-?0x[0-9a-fA-F]+|-?\d+)' # 允许十六进制和十进制
-        label = r'[a-zA-Z_]\w*'
-        target = f'({imm}|{label})'
-
-        patterns = [
-            (rf'{reg},\s*{reg},\s*{reg}', ('R')),
-            (rf'{reg},\s*{reg},\s*{target}', ('I', 'I-shift', 'B')),
-            (rf'{reg},\s*{imm}\({reg}\)', ('S', 'I-load')),
-            (rf'{reg},\s*{target}', ('U', 'J')),
-        ]
-
-        line_to_parse = ' '.join(cleaned.split()[1:])
-
-        matched = False
-        for pattern, types in patterns:
-            if instr_type not in types: continue
-            match = re.fullmatch(pattern, line_to_parse.lower())
-            if match:
-                operands = list(match.groups())
-
-                # 清理由于正则表达式OR操作产生的None值
-                operands = [op for op in operands if op is not None]
-
-                if instr_type in ('B', 'J'):
-                    op_target = operands[-1]
-                    offset = 0
-                    try:
-                        offset = int(op_target, 0)
-                    except ValueError:
-                        target_lower = op_target.lower()
-                        if target_lower not in symbol_table:
-                            errors.append(f"第 {line_num} 行: 未定义的标签 '{op_target}'")
-                            matched = True; break
-
-                        target_address = symbol_table[target_lower]
-                        offset = target_address - address
-
-                    operands[-1] = str(offset)
-
-                # print("即将处理的操作数:", operands)
-
-                handler_map = {
-                    'R': handle_r_type, 'I': handle_i_type, 'I-shift': handle_i_shift_type,
-                    'I-load': handle_i_load_type, 'S': handle_s_type, 'B': handle_b_type,
-                    'U': handle_u_type, 'J': handle_j_type,
-                }
-
-                code, err = handler_map[instr_type](instr_info, operands)
-                if err:
-                    errors.append(f"第 {line_num} 行 ({cleaned}): {err}")
-                else:
-                    machine_codes.append(code)
-                matched = True
-                break
-
-        if not matched and not any(f"第 {line_num} 行" in e for e in errors):
-            errors.append(f"第 {line_num} 行: 无法解析的操作数格式 '{line_to_parse}'")
+        offset = None
+        if instr_info['type'] in ('B', 'J'):
+            op_target = operands[-1]
+            try:
+                offset = int(op_target, 0)
+            except ValueError:
+                if op_target not in symbol_table:
+                    errors.append(f"第 {line_num} 行: 未定义的标签 '{op_target}'")
+                    address += 4
+                    continue
+                offset = symbol_table[op_target] - address
+
+        code, err = encode_instruction(instr_info, operands, offset)
+        if err:
+            errors.append(f"第 {line_num} 行 ({cleaned}): {err}")
+        else:
+            machine_codes.append(code)
+            if source_line_map is not None:
+                source_line_map.append((len(machine_codes) - 1, line_num))
 
         address += 4
     return machine_codes, errors
 
-def assemble(input_file_path, output_file_path):
+def _single_pass_core(lines, emit, patch, source_line_map=None):
+    """
+    单遍汇编核心：每行只清理、解析一次并立即通过 emit(code) 输出机器码。
+    B/J 指令引用尚未出现的标签时先输出占位的 0，记入回填表 (fixups)，
+    全部读完后再按最终的符号表通过 patch(index, code) 统一回填。
+    传入 source_line_map 列表时，依次追加 (机器码索引, 源代码行号)。
+    返回 (机器码条数, 错误列表, 符号表, 回填失败的机器码索引)；重复定义标签的错误排在最前面
+    """
+    symbol_table, label_lines, label_errors = {}, {}, []
+    count = 0
+    fixups = []  # (机器码索引, 指令地址, 行号, 指令文本, 指令信息, 操作数)
+    errors = []  # (行号, 错误信息)，最后按行号排序
+    address = 0
+    for line_num, line in enumerate(lines, 1):
+        label, cleaned = tokenize_line(line)
+        if label is not None:
+            _define_label(symbol_table, label_lines, label, address, line_num, label_errors)
+        if not cleaned: continue
+
+        instr_info, operands, err = parse_instruction(cleaned)
+        if err:
+            errors.append((line_num, f"第 {line_num} 行: {err}"))
+            address += 4
+            continue
+
+        offset = None
+        if instr_info['type'] in ('B', 'J'):
+            op_target = operands[-1]
+            try:
+                offset = int(op_target, 0)
+            except ValueError:
+                if op_target not in symbol_table:
+                    # 向前引用：占位并等待回填
+                    fixups.append((count, address, line_num, cleaned, instr_info, operands))
+                    emit(0)
+                    if source_line_map is not None:
+                        source_line_map.append((count, line_num))
+                    count += 1
+                    address += 4
+                    continue
+                offset = symbol_table[op_target] - address
+
+        code, err = encode_instruction(instr_info, operands, offset)
+        if err:
+            errors.append((line_num, f"第 {line_num} 行 ({cleaned}): {err}"))
+        else:
+            emit(code)
+            if source_line_map is not None:
+                source_line_map.append((count, line_num))
+            count += 1
+
+        address += 4
+
+    # 回填所有向前引用
+    failed = []
+    for index, instr_address, line_num, cleaned, instr_info, operands in fixups:
+        op_target = operands[-1]
+        if op_target not in symbol_table:
+            errors.append((line_num, f"第 {line_num} 行: 未定义的标签 '{op_target}'"))
+            failed.append(index)
+            continue
+        code, err = encode_instruction(instr_info, operands, symbol_table[op_target] - instr_address)
+        if err:
+            errors.append((line_num, f"第 {line_num} 行 ({cleaned}): {err}"))
+            failed.append(index)
+        else:
+            patch(index, code)
+
+    errors.sort(key=lambda item: item[0])
+    return count, label_errors + [msg for _, msg in errors], symbol_table, failed
+
+def single_pass(lines, source_line_map=None):
+    """
+    单遍汇编，机器码保存在内存列表中。
+    返回 (machine_codes, errors, symbol_table)
+    """
+    machine_codes = []
+    _, errors, symbol_table, failed = _single_pass_core(lines, machine_codes.append, machine_codes.__setitem__,
+                                                        source_line_map)
+    # 与两遍模式保持一致：出错的指令不占用机器码位置
+    for index in reversed(failed):
+        del machine_codes[index]
+    return machine_codes, errors, symbol_table
+
+# ==============================================================================
+# 输出格式
+# 每个写出函数把整段机器码一次性编码为一个 bytes 缓冲区，由 assemble() 一次写入文件
+# ==============================================================================
+def words_to_le_bytes(words):
+    """32 位机器码 -> 小端字节序的原始二进制 (与 upload_code_bin.py 读取的 .bin 布局一致)"""
+    buf = array('I', words)
+    if buf.itemsize != 4:
+        buf = array('L', words)
+    if sys.byteorder == 'big':
+        buf.byteswap()
+    return buf.tobytes()
+
+def format_binary_text(words):
+    """每行一条 32 位 '0'/'1' 字符串 (原 output.txt 格式)"""
+    return ''.join([to_binary_string(word) + '\n' for word in words]).encode('ascii')
+
+def format_raw_binary(words):
+    return words_to_le_bytes(words)
+
+def format_readmemh(words):
+    """Verilog $readmemh 格式：每行一个 32 位字的十六进制"""
+    return ''.join([f'{word:08x}\n' for word in words]).encode('ascii')
+
+def format_intel_hex(words, base_address=0, record_size=16):
+    """Intel HEX 格式：每条数据记录 16 字节，跨 64KB 时插入扩展线性地址记录"""
+    data = words_to_le_bytes(words)
+    out = []
+    upper = None
+    for pos in range(0, len(data), record_size):
+        address = base_address + pos
+        if address >> 16 != upper:
+            upper = address >> 16
+            record = bytes([2, 0, 0, 4, upper >> 8, upper & 0xFF])
+            out.append(':' + record.hex().upper() + f'{-sum(record) & 0xFF:02X}\n')
+        chunk = data[pos:pos + record_size]
+        record = bytes([len(chunk), (address >> 8) & 0xFF, address & 0xFF, 0]) + chunk
+        out.append(':' + record.hex().upper() + f'{-sum(record) & 0xFF:02X}\n')
+    out.append(':00000001FF\n')
+    return ''.join(out).encode('ascii')
+
+OUTPUT_WRITERS = {
+    'txt': format_binary_text,
+    'bin': format_raw_binary,
+    'hex': format_intel_hex,
+    'mem': format_readmemh,
+}
+
+# 根据输出文件扩展名推断格式，未知扩展名按原 '0'/'1' 文本输出
+FORMAT_BY_EXTENSION = {'.bin': 'bin', '.hex': 'hex', '.ihex': 'hex', '.mem': 'mem'}
+
+def guess_output_format(output_file_path):
+    return FORMAT_BY_EXTENSION.get(os.path.splitext(output_file_path)[1].lower(), 'txt')
+
+# 流式输出支持的定长记录格式: 格式 -> (每条记录字节数, 编码函数)
+STREAM_RECORDS = {
+    'txt': (33, lambda code: b'%s\n' % to_binary_string(code).encode('ascii')),
+    'bin': (4, lambda code: code.to_bytes(4, 'little')),
+    'mem': (9, lambda code: b'%08x\n' % code),
+}
+
+def assemble_stream(lines, outfile, fmt='txt'):
+    """
+    流式汇编：lines 可以是文件对象等任意可迭代对象，按行惰性读取；
+    机器码生成后立即写入 outfile (以二进制模式打开、可 seek 的文件)，
+    向前引用的占位记录在最后通过 seek 原地回填。
+    内存中只保留符号表和待回填表，与程序长度无关。
+    fmt 只能是定长记录格式 (STREAM_RECORDS)。
+    返回 (机器码条数, 错误列表, 符号表)
+    """
+    record_size, encode_record = STREAM_RECORDS[fmt]
+
+    def patch(index, code):
+        outfile.seek(index * record_size)
+        outfile.write(encode_record(code))
+
+    count, errors, symbol_table, _ = _single_pass_core(lines, lambda code: outfile.write(encode_record(code)), patch)
+    outfile.seek(0, os.SEEK_END)
+    return count, errors, symbol_table
+
+def _assemble_streaming(input_file_path, output_file_path, fmt):
+    if fmt not in STREAM_RECORDS:
+        print(f"错误: 流式汇编不支持 '{fmt}' 格式 (仅支持 {', '.join(STREAM_RECORDS)})。")
+        return
+
+    # 先写入临时文件，成功后再替换，避免出错时留下半成品
+    temp_path = output_file_path + '.tmp'
     try:
-        with open(input_file_path, 'r', encoding='utf-8') as infile:
-            lines = infile.readlines()
+        with open(input_file_path, 'r', encoding='utf-8') as infile, open(temp_path, 'wb') as outfile:
+            count, errors, _ = assemble_stream(infile, outfile, fmt)
     except FileNotFoundError:
         print(f"错误: 输入文件 '{input_file_path}' 未找到。")
         return
     except Exception as e:
-        print(f"读取文件时发生错误: {e}")
+        print(f"流式汇编时发生错误: {e}")
+        if os.path.exists(temp_path): os.remove(temp_path)
         return
 
-    symbol_table, err = first_pass(lines)
-    if err:
-        print(f"第一遍扫描出错误: {err}")
-        return
-
-    machine_codes, errors = second_pass(lines, symbol_table)
-
     if errors:
+        os.remove(temp_path)
         print("汇编过程中发现错误:")
         for e in errors: print(f"- {e}")
         print("由于存在错误，未生成输出文件。")
         return
 
+    os.replace(temp_path, output_file_path)
+    print(f"汇编成功！共 {count} 条指令。机器码已保存至 '{output_file_path}'。")
+
+# ==============================================================================
+# 增量汇编 (供可视化界面反复汇编同一个编辑缓冲区使用)
+# ==============================================================================
+class IncrementalAssembler:
+    """
+    按行缓存编码结果的增量汇编器。
+    - 原始行 -> (标签, 指令文本)：每行只做一次清理和标签识别
+    - 指令文本 -> 编码结果：与地址无关的指令 (除 B/J 标签跳转外的全部指令) 直接复用
+    - (指令文本, 偏移量) -> 编码结果：B/J 标签跳转的编码只取决于
+      "目标标签地址 - 指令地址"，只有这个偏移量变化时才重新编码
+    每次汇编后只保留本次用到的缓存项，内存与当前程序规模成正比。
+    """
+
+    def __init__(self):
+        self._tokens = {}    # 原始行 -> (标签, 指令文本)
+        self._parsed = {}    # 指令文本 -> 解析/编码结果
+        self._encoded = {}   # (指令文本, 偏移量) -> (机器码, 错误)
+        self.hits = 0
+        self.misses = 0
+
+    def _parse(self, cleaned):
+        """
+        返回以下三种之一:
+        ('error', 错误信息)                     解析失败
+        ('code', 机器码, 错误)                  已编码完成，与地址无关
+        ('label', 指令信息, 操作数, 目标标签)    B/J 标签跳转，需要按偏移量编码
+        """
+        instr_info, operands, err = parse_instruction(cleaned)
+        if err:
+            return ('error', err)
+        offset = None
+        if instr_info['type'] in ('B', 'J'):
+            try:
+                offset = int(operands[-1], 0)
+            except ValueError:
+                return ('label', instr_info, operands, operands[-1])
+        code, err = encode_instruction(instr_info, operands, offset)
+        return ('code', code, err)
+
+    def assemble(self, lines):
+        """
+        汇编整个缓冲区。
+        返回 (machine_codes, errors, source_line_map, symbol_table)，
+        source_line_map 为 [(机器码索引, 源代码行号), ...]
+        """
+        old_tokens, old_parsed, old_encoded = self._tokens, self._parsed, self._encoded
+        tokens, parsed_cache, encoded_cache = {}, {}, {}
+        hits = misses = 0
+
+        # 第一遍：标签扫描 (只对新出现的行做清理)
+        line_tokens = []
+        for line in lines:
+            token = tokens.get(line)
+            if token is None:
+                token = old_tokens.get(line)
+                if token is None:
+                    token = tokenize_line(line)
+                tokens[line] = token
+            line_tokens.append(token)
+
+        symbol_table, label_lines, errors = {}, {}, []
+        address = 0
+        for line_num, (label, cleaned) in enumerate(line_tokens, 1):
+            if label is not None:
+                _define_label(symbol_table, label_lines, label, address, line_num, errors)
+            if cleaned: address += 4
+
+        # 第二遍：编码 (命中缓存的行直接复用)
+        machine_codes = []
+        source_line_map = []
+        address = 0
+        for line_num, (_, cleaned) in enumerate(line_tokens, 1):
+            if not cleaned: continue
+
+            parsed = parsed_cache.get(cleaned)
+            if parsed is None:
+                parsed = old_parsed.get(cleaned)
+                if parsed is None:
+                    parsed = self._parse(cleaned)
+                    misses += 1
+                else:
+                    hits += 1
+                parsed_cache[cleaned] = parsed
+            else:
+                hits += 1
+
+            kind = parsed[0]
+            if kind == 'error':
+                errors.append(f"第 {line_num} 行: {parsed[1]}")
+                address += 4
+                continue
+
+            if kind == 'code':
+                code, err = parsed[1], parsed[2]
+            else:
+                _, instr_info, operands, target = parsed
+                if target not in symbol_table:
+                    errors.append(f"第 {line_num} 行: 未定义的标签 '{target}'")
+                    address += 4
+                    continue
+                key = (cleaned, symbol_table[target] - address)
+                result = encoded_cache.get(key) or old_encoded.get(key)
+                if result is None:
+                    result = encode_instruction(instr_info, list(operands), key[1])
+                    misses += 1
+                else:
+                    hits += 1
+                encoded_cache[key] = result
+                code, err = result
+
+            if err:
+                errors.append(f"第 {line_num} 行 ({cleaned}): {err}")
+            else:
+                machine_codes.append(code)
+                source_line_map.append((len(machine_codes) - 1, line_num))
+            address += 4
+
+        self._tokens, self._parsed, self._encoded = tokens, parsed_cache, encoded_cache
+        self.hits, self.misses = hits, misses
+        return machine_codes, errors, source_line_map, symbol_table
+
+# ==============================================================================
+# 多进程并行汇编
+# ==============================================================================
+def first_pass_chunked(lines, chunk_lines):
+    """
+    first_pass 的分块版本：在建立符号表的同时，记录每个分块 (chunk_lines 行) 开头的指令地址。
+    返回 (symbol_table, [(起始行索引, 起始地址), ...], 重复定义标签的错误列表)
+    """
+    symbol_table, label_lines, errors = {}, {}, []
+    chunk_starts = []
+    address = 0
+    for index, line in enumerate(lines):
+        if index % chunk_lines == 0:
+            chunk_starts.append((index, address))
+        label, text = tokenize_line(line)
+        if label is not None:
+            _define_label(symbol_table, label_lines, label, address, index + 1, errors)
+        if text: address += 4
+    return symbol_table, chunk_starts, errors
+
+_worker_symbol_table = None
+
+def _init_worker(symbol_table):
+    # 每个工作进程只接收一次共享的符号表
+    global _worker_symbol_table
+    _worker_symbol_table = symbol_table
+
+def _encode_chunk(args, symbol_table=None):
+    chunk, start_address, start_line = args
+    if symbol_table is None:
+        symbol_table = _worker_symbol_table
+    chunk_line_map = []
+    codes, errors = second_pass(chunk, symbol_table, start_address, start_line, chunk_line_map)
+    return codes, errors, chunk_line_map
+
+def assemble_parallel(lines, jobs=None, chunk_lines=None, source_line_map=None):
+    """
+    并行汇编一个大型程序：先做一次廉价的标签地址扫描，再把源代码切成若干分块，
+    在进程池中用共享的符号表分别编码，最后按顺序拼接机器码并合并错误 (行号保持不变)。
+    传入 source_line_map 列表时，依次追加 (机器码索引, 源代码行号)。
+    返回 (machine_codes, errors, symbol_table)
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if chunk_lines is None:
+        chunk_lines = max(1000, -(-len(lines) // (jobs * 4)))
+
+    symbol_table, chunk_starts, errors = first_pass_chunked(lines, chunk_lines)
+    tasks = [(lines[index:index + chunk_lines], address, index + 1) for index, address in chunk_starts]
+
+    machine_codes = []
+
+    def merge(results):
+        for codes, chunk_errors, chunk_line_map in results:
+            if source_line_map is not None:
+                base = len(machine_codes)
+                source_line_map.extend((base + index, line_num) for index, line_num in chunk_line_map)
+            machine_codes.extend(codes)
+            errors.extend(chunk_errors)
+
+    if jobs <= 1 or len(tasks) <= 1:
+        merge(_encode_chunk(task, symbol_table) for task in tasks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(symbol_table,)) as pool:
+            merge(pool.map(_encode_chunk, tasks))
+    return machine_codes, errors, symbol_table
+
+# 单个文件的统计: 源代码行数、机器码条数、输出字节数、墙钟时间与 CPU 时间 (秒)
+FileStats = namedtuple('FileStats', ['lines', 'instructions', 'bytes', 'wall', 'cpu'])
+
+def list_sources(directory):
+    """列出目录中的汇编源文件 (.txt/.s)，按文件名排序"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(('.txt', '.s')))
+
+def _assemble_file_task(args):
+    input_file_path, output_file_path, fmt, cache_dir, one_pass, jobs = args
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
     try:
-        with open(output_file_path, 'w', encoding='utf-8') as outfile:
-            for code in machine_codes:
-                outfile.write(code + '\n')
-        print(f"汇编成功！共 {len(machine_codes)} 条指令。机器码已保存至 '{output_file_path}'。")
+        result = assemble_file(input_file_path, output_file_path, fmt, one_pass, jobs, cache_dir)
     except Exception as e:
-        print(f"写入输出文件时发生错误: {e}")
+        return input_file_path, None, str(e), None
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    # 统计信息在计时结束后再收集，不计入耗时
+    with open(input_file_path, 'rb') as infile:
+        num_lines = sum(1 for _ in infile)
+    # 有错误时没有写出任何机器码，指令数与字节数都记为 0
+    num_instructions, num_bytes = (0, 0) if result[1] else (result[0], os.path.getsize(output_file_path))
+    return input_file_path, result, None, FileStats(num_lines, num_instructions, num_bytes, wall, cpu)
+
+def _check_overwrites(input_paths, output_paths):
+    """输出文件是某个输入文件 (如 -o 指向源文件所在目录且格式为 txt) 时抛出 ValueError，不覆盖源文件"""
+    inputs = {os.path.normcase(os.path.realpath(path)) for path in input_paths}
+    input_ids = set()
+    for path in input_paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        input_ids.add((st.st_dev, st.st_ino))
+    for input_path, output_path in zip(input_paths, output_paths):
+        if os.path.normcase(os.path.realpath(output_path)) in inputs:
+            same = True
+        else:
+            try:
+                st = os.stat(output_path)
+            except OSError:
+                continue
+            same = (st.st_dev, st.st_ino) in input_ids # 硬链接等路径不同的同一个文件
+        if same:
+            raise ValueError(f"输出文件 '{output_path}' 是输入文件，会覆盖源代码 "
+                             f"(来自 '{input_path}'，请换一个输出目录或输出格式)")
+
+def assemble_batch(input_paths, output_dir, fmt='txt', jobs=None, cache_dir=None, one_pass=False):
+    """
+    批量汇编：在进程池中并发汇编多个 .txt/.s 文件，输出到 output_dir (文件名不变，扩展名按格式替换)。
+    input_paths 可以是文件列表或一个目录；cache_dir 为磁盘缓存目录 (见 AssemblyCache)。
+    只有一个输入文件时，jobs 用于该文件内部的分块并行汇编。
+    返回 [(输入文件, (机器码条数, 错误列表) 或 None, 异常信息或 None, FileStats 或 None), ...]，顺序与输入一致。
+    某个输出文件就是输入文件之一时不汇编任何文件，抛出 ValueError
+    """
+    if isinstance(input_paths, str) and os.path.isdir(input_paths):
+        input_paths = list_sources(input_paths)
+
+    extension = {'txt': '.txt', 'bin': '.bin', 'hex': '.hex', 'mem': '.mem'}[fmt]
+    tasks = []
+    for path in input_paths:
+        name = os.path.splitext(os.path.basename(path))[0] + extension
+        tasks.append((path, os.path.join(output_dir, name), fmt, cache_dir, one_pass, 1))
+    _check_overwrites(input_paths, [task[1] for task in tasks])
+    os.makedirs(output_dir, exist_ok=True)
+
+    if len(tasks) == 1:
+        return [_assemble_file_task(tasks[0][:-1] + (jobs,))]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1:
+        return [_assemble_file_task(task) for task in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_assemble_file_task, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
+
+# ==============================================================================
+# 库接口
+# GUI、反汇编器和批处理工具都通过这里汇编内存中的源代码，不读写任何文件。
+# ==============================================================================
+# words: 32 位整数机器码列表; symbols: 标签 -> 地址; line_map: [(机器码索引, 源代码行号)];
+# errors: 错误信息列表 (为空表示汇编成功)
+AssemblyResult = namedtuple('AssemblyResult', ['words', 'symbols', 'line_map', 'errors'])
+
+def assemble_lines(lines, one_pass=False, jobs=1):
+    """
+    汇编源代码行列表。one_pass 选择单遍模式，jobs 不为 1 时多进程并行。
+    返回 AssemblyResult
+    """
+    source_line_map = []
+    if jobs != 1:
+        machine_codes, errors, symbol_table = assemble_parallel(lines, jobs, source_line_map=source_line_map)
+    elif one_pass:
+        machine_codes, errors, symbol_table = single_pass(lines, source_line_map)
+    else:
+        symbol_table, label_errors = first_pass(lines)
+        machine_codes, errors = second_pass(lines, symbol_table, source_line_map=source_line_map)
+        errors = label_errors + errors
+    return AssemblyResult(machine_codes, symbol_table, source_line_map, errors)
+
+def assemble_text(text, one_pass=False, jobs=1):
+    """汇编一段源代码字符串 (换行符 \n、\r\n、\r 均可)，返回 AssemblyResult"""
+    return assemble_lines(io.StringIO(text, newline=None).readlines(), one_pass, jobs)
 
 # ==============================================================================
-# 使用示例
+# 磁盘缓存
+# 以 (汇编器版本, 源文件内容) 的哈希为键，把机器码、符号表和 PC 到源代码行号的映射
+# 持久化到缓存目录，重复汇编未修改的文件 (如 GUI 重新打开、批量构建) 时直接读取。
+# 每个条目由两个文件组成:
+#   <key>.bin   机器码，小端序 32 位字的原始字节，读取时通过 mmap 映射
+#   <key>.json  元数据: 指令条数、符号表、行号映射
+# 缓存目录总大小超过上限时，按最近使用时间 (元数据文件的 mtime) 淘汰最旧的条目。
 # ==============================================================================
-script_path = os.path.abspath(__file__)
-project_root = os.path.dirname(os.path.dirname(script_path))
-input_filename = os.path.join(project_root, 'data', 'input.txt')
-output_filename = os.path.join(project_root, 'data', 'output.txt')
+class CachedAssembly:
+    """
+    一个缓存命中的结果。words 是机器码序列 (直接引用 mmap 的内存，不复制)，
+    raw_bytes 为小端序原始字节。使用完毕后应调用 close()，也可以用作 with 语句的上下文管理器。
+    """
+    def __init__(self, mapped, count, symbol_table, source_line_map):
+        self._mapped = mapped
+        self.count = count
+        self.symbol_table = symbol_table
+        self.source_line_map = source_line_map
+        if mapped is None:
+            self.raw_bytes = memoryview(b'')
+            self.words = array('I')
+        else:
+            self.raw_bytes = memoryview(mapped)
+            if sys.byteorder == 'little':
+                self.words = self.raw_bytes.cast('I')
+            else:
+                self.words = array('I', self.raw_bytes)
+                self.words.byteswap()
+
+    def close(self):
+        # 先释放所有 memoryview，mmap 才能关闭
+        if isinstance(self.words, memoryview):
+            self.words.release()
+        self.raw_bytes.release()
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+TEMP_SUFFIX = '.tmp'
+STALE_TEMP_SECONDS = 3600 # 超过这个时间的临时文件视为残留，由 _evict 删除
+
+class AssemblyCache:
+    """基于内容哈希的持久化汇编缓存，目录总大小限制为 max_bytes (LRU 淘汰)"""
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key_for(source_bytes):
+        digest = hashlib.sha256(ASSEMBLER_VERSION.encode('ascii') + b'\0')
+        digest.update(source_bytes)
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.bin', base + '.json'
+
+    def load(self, key):
+        """返回 CachedAssembly；未命中或条目损坏时返回 None"""
+        bin_path, meta_path = self._paths(key)
+        mapped = None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != ASSEMBLER_VERSION:
+                return None
+            count = meta['count']
+            # 元数据不完整 (被截断或旧格式) 时同样按未命中处理
+            symbol_table = meta['symbol_table']
+            source_line_map = [tuple(pair) for pair in meta['source_line_map']]
+            if count:
+                with open(bin_path, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(mapped) != count * 4:
+                    mapped.close()
+                    return None
+            # 更新访问时间，供 LRU 淘汰使用
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            if mapped is not None:
+                mapped.close()
+            return None
+        return CachedAssembly(mapped, count, symbol_table, source_line_map)
+
+    def store(self, key, machine_codes, symbol_table, source_line_map):
+        bin_path, meta_path = self._paths(key)
+        meta = {
+            'version': ASSEMBLER_VERSION,
+            'count': len(machine_codes),
+            'symbol_table': symbol_table,
+            'source_line_map': source_line_map,
+        }
+        # 先写临时文件再原子替换，避免并发读取到写了一半的条目；元数据最后写入
+        self._write_atomic(bin_path, words_to_le_bytes(machine_codes))
+        self._write_atomic(meta_path, json.dumps(meta, separators=(',', ':')).encode('utf-8'))
+        self._evict()
+
+    def _write_atomic(self, path, data):
+        # 每次写入使用唯一的临时文件: 多个进程同时缓存同一个键 (内容相同的输入文件) 时互不干扰
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        finally:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass # 已经替换到位
+
+    def _evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(TEMP_SUFFIX):
+                # 进程中途退出留下的临时文件；其他进程正在写的临时文件很新，不删除
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    if now - os.stat(path).st_mtime > STALE_TEMP_SECONDS:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            key = name[:-5]
+            size = 0
+            mtime = None
+            for path in self._paths(key):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                size += st.st_size
+                if path.endswith('.json'):
+                    mtime = st.st_mtime
+            if mtime is None:
+                continue
+            entries.append((mtime, key, size))
+            total += size
 
-assemble(input_filename, output_filename)
\ No newline at end of file
+        entries.sort()
+        for _, key, size in entries:
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+# ==============================================================================
+# 文件接口
+# ==============================================================================
+def assemble_file(input_file_path, output_file_path, fmt=None, one_pass=False, jobs=1, cache_dir=None):
+    """
+    汇编一个文件；没有错误时写出机器码。不打印信息，读写失败时直接抛出异常。
+    给出 cache_dir 时先查询磁盘缓存 (见 AssemblyCache)，并缓存成功的汇编结果；缓存读写失败时只是不使用缓存。
+    返回 (机器码条数, 错误列表)
+    """
+    if fmt is None:
+        fmt = guess_output_format(output_file_path)
+    with open(input_file_path, 'rb') as infile:
+        source = infile.read()
+
+    cache = key = cached = None
+    if cache_dir is not None:
+        key = AssemblyCache.key_for(source)
+        try:
+            cache = AssemblyCache(cache_dir)
+        except OSError:
+            pass # 缓存目录无法创建时照常汇编，只是不使用缓存
+        else:
+            cached = cache.load(key)
+        if cached is not None:
+            with cached:
+                data = cached.raw_bytes if fmt == 'bin' else OUTPUT_WRITERS[fmt](cached.words)
+                with open(output_file_path, 'wb') as outfile:
+                    outfile.write(data)
+                return cached.count, []
+
+    result = assemble_text(source.decode('utf-8'), one_pass, jobs)
+
+    if not result.errors:
+        data = OUTPUT_WRITERS[fmt](result.words)
+        with open(output_file_path, 'wb') as outfile:
+            outfile.write(data)
+        if cache is not None:
+            try:
+                cache.store(key, result.words, result.symbols, result.line_map)
+            except OSError:
+                pass # 缓存写入失败 (磁盘满、目录只读等) 不影响已经写出的结果
+    return len(result.words), result.errors
+
+def assemble(input_file_path, output_file_path, one_pass=False, stream=False, fmt=None, jobs=1, cache_dir=None):
+    """
+    汇编 input_file_path 并写入 output_file_path。
+    fmt 为输出格式 ('txt', 'bin', 'hex', 'mem')，默认根据输出文件扩展名推断；
+    jobs 不为 1 时使用多进程并行汇编 (None 表示使用全部 CPU 核心)；
+    cache_dir 为磁盘缓存目录，源文件未修改时直接复用上次的结果。
+    """
+    if fmt is None:
+        fmt = guess_output_format(output_file_path)
+    if fmt not in OUTPUT_WRITERS:
+        print(f"错误: 未知的输出格式 '{fmt}' (可选: {', '.join(OUTPUT_WRITERS)})。")
+        return
+
+    if stream:
+        if cache_dir is not None:
+            # 流式汇编不在内存中保留机器码和行号映射，无法写入缓存
+            print("错误: 流式汇编不支持磁盘缓存，请不要同时指定 stream 和 cache_dir。")
+            return
+        _assemble_streaming(input_file_path, output_file_path, fmt)
+        return
+
+    try:
+        count, errors = assemble_file(input_file_path, output_file_path, fmt, one_pass, jobs, cache_dir)
+    except FileNotFoundError:
+        print(f"错误: 输入文件 '{input_file_path}' 未找到。")
+        return
+    except Exception as e:
+        print(f"汇编时发生错误: {e}")
+        return
+
+    if errors:
+        print("汇编过程中发现错误:")
+        for e in errors: print(f"- {e}")
+        print("由于存在错误，未生成输出文件。")
+        return
+
+    print(f"汇编成功！共 {count} 条指令。机器码已保存至 '{output_file_path}'。")
+
+# ==============================================================================
+# 命令行接口
+# 不带参数运行时保持原来的行为: 汇编 data/input.txt 并写入 data/output.txt。
+# 用法示例:
+#   python src/assembler.py tests/*.s src/C -o build -f bin -j 8 --stats
+# ==============================================================================
+# 批量模式下每个文件最多打印的错误条数
+MAX_REPORTED_ERRORS = 10
+
+def _expand_inputs(patterns):
+    """把命令行给出的文件、目录和通配符展开成源文件列表 (去重并保持顺序)，返回 (文件列表, 无匹配的参数)"""
+    import glob
+    paths, unmatched = [], []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matched = list_sources(pattern)
+        elif os.path.isfile(pattern):
+            matched = [pattern]
+        else:
+            matched = sorted(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+        if not matched:
+            unmatched.append(pattern)
+        paths.extend(matched)
+    return list(dict.fromkeys(paths)), unmatched
+
+def _print_stats(results, elapsed):
+    print(f"{'文件':<40} {'行数':>9} {'指令':>9} {'字节':>10} {'墙钟(ms)':>10} {'CPU(ms)':>10}")
+    total_lines = total_instructions = total_bytes = 0
+    total_cpu = 0.0
+    for path, _, _, stats in results:
+        if stats is None:
+            print(f"{path:<40} {'-':>9} {'-':>9} {'-':>10} {'-':>10} {'-':>10}")
+            continue
+        print(f"{path:<40} {stats.lines:>9} {stats.instructions:>9} {stats.bytes:>10} "
+              f"{stats.wall * 1000:>10.2f} {stats.cpu * 1000:>10.2f}")
+        total_lines += stats.lines
+        total_instructions += stats.instructions
+        total_bytes += stats.bytes
+        total_cpu += stats.cpu
+    print(f"{'合计':<40} {total_lines:>9} {total_instructions:>9} {total_bytes:>10} "
+          f"{elapsed * 1000:>10.2f} {total_cpu * 1000:>10.2f}")
+    if elapsed > 0:
+        print(f"吞吐量: {len(results) / elapsed:,.1f} 文件/秒, {total_lines / elapsed:,.0f} 行/秒")
+
+def main(argv=None):
+    """命令行入口，返回进程退出码 (0 表示全部成功)"""
+    import argparse
+    parser = argparse.ArgumentParser(description='RISC-V RV32IM 汇编器 (批量模式)')
+    parser.add_argument('inputs', nargs='*', help='输入文件、目录或通配符 (如 "tests/**/*.s")')
+    parser.add_argument('-o', '--output-dir', help='输出目录 (给出输入文件时必填)')
+    parser.add_argument('-f', '--format', default='txt', choices=list(OUTPUT_WRITERS), help='输出格式，默认 txt')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='并行进程数，0 表示使用全部 CPU 核心')
+    parser.add_argument('--one-pass', action='store_true', help='使用单遍汇编模式')
+    parser.add_argument('--cache-dir', help='磁盘缓存目录')
+    parser.add_argument('--stats', action='store_true', help='打印每个文件的行数、指令数、字节数和耗时')
+    args = parser.parse_args(argv)
+
+    if not args.inputs:
+        script_path = os.path.abspath(__file__)
+        project_root = os.path.dirname(os.path.dirname(script_path))
+        input_filename = os.path.join(project_root, 'data', 'input.txt')
+        output_filename = os.path.join(project_root, 'data', 'output.txt')
+        assemble(input_filename, output_filename, one_pass=args.one_pass, cache_dir=args.cache_dir)
+        return 0
+
+    if args.output_dir is None:
+        parser.error('给出输入文件时必须用 -o/--output-dir 指定输出目录')
+    if args.jobs < 0:
+        parser.error('--jobs 不能为负数')
+
+    input_paths, unmatched = _expand_inputs(args.inputs)
+    for pattern in unmatched:
+        print(f"警告: '{pattern}' 没有匹配到任何文件。")
+    # 不同目录下的同名文件会写到同一个输出文件，提前报错
+    names = {}
+    for path in input_paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name in names:
+            print(f"错误: '{names[name]}' 与 '{path}' 的输出文件名相同。")
+            return 2
+        names[name] = path
+    if not input_paths:
+        print("错误: 没有可汇编的输入文件。")
+        return 2
+
+    start = time.perf_counter()
+    try:
+        results = assemble_batch(input_paths, args.output_dir, args.format, args.jobs or None,
+                                 args.cache_dir, args.one_pass)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 2
+    elapsed = time.perf_counter() - start
+
+    failed = 0
+    for path, result, exc, _ in results:
+        if exc is not None:
+            print(f"{path}: 汇编时发生错误: {exc}")
+            failed += 1
+        elif result[1]:
+            errors = result[1]
+            print(f"{path}: 发现 {len(errors)} 个错误，未生成输出文件:")
+            for e in errors[:MAX_REPORTED_ERRORS]: print(f"- {e}")
+            if len(errors) > MAX_REPORTED_ERRORS:
+                print(f"- ... 另有 {len(errors) - MAX_REPORTED_ERRORS} 个错误")
+            failed += 1
+
+    if args.stats:
+        _print_stats(results, elapsed)
+    print(f"共 {len(results)} 个文件，成功 {len(results) - failed} 个，失败 {failed} 个。")
+    return 1 if failed else 0
+
+# 多进程汇编时工作进程会重新导入本模块，入口必须放在 __main__ 保护之下
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import contextlib
+import os
+import random
+import sys
+import time
+
+import assembler
+
+# ==============================================================================
+# 汇编器性能基准
+# 生成一个大型的随机汇编程序 (覆盖 R/I/S/B/U/J 全部格式与标签跳转)，
+# 分别统计两遍 (first_pass + second_pass) 与单遍 (single_pass) 模式每秒处理的源代码行数。
+# 模拟器性能基准
+# 在 src/C 中的 RV32IM 示例程序上单步执行，统计每秒执行的指令数。
+# 用法: python src/benchmark.py [行数]
+# ==============================================================================
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+SIM_PROGRAMS = ['led', 'input', 'rx_and_print', 'timer_display']
+
+BENCH_REGS = ['zero', 'ra', 'sp', 't0', 't1', 't2', 'a0', 'a1', 'a2', 's0', 's1', 'x5', 'x31']
+
+
+def generate_program(num_lines, seed=2025):
+    """生成 num_lines 行左右的合成汇编代码，每 20 行插入一个标签"""
+    rng = random.Random(seed)
+    by_type = {}
+    for name, info in assembler.INSTRUCTION_MAP.items():
+        by_type.setdefault(info['type'], []).append(name)
+    num_labels = max(1, num_lines // 20)
+
+    def reg():
+        return rng.choice(BENCH_REGS)
+
+    lines = []
+    for i in range(num_lines):
+        if i % 20 == 0:
+            lines.append(f"L{i // 20}:")
+        instr_type = rng.choice(list(by_type))
+        mnemonic = rng.choice(by_type[instr_type])
+        if instr_type == 'R':
+            lines.append(f"    {mnemonic} {reg()}, {reg()}, {reg()}    # R-type")
+        elif instr_type == 'I':
+            lines.append(f"    {mnemonic} {reg()}, {reg()}, {rng.randint(-2048, 2047)}")
+        elif instr_type == 'I-shift':
+            lines.append(f"    {mnemonic} {reg()}, {reg()}, {rng.randint(0, 31)}")
+        elif instr_type in ('I-load', 'S'):
+            lines.append(f"    {mnemonic} {reg()}, {rng.randint(-2048, 2047)}({reg()})")
+        elif instr_type == 'B':
+            lines.append(f"    {mnemonic} {reg()}, {reg()}, L{rng.randrange(num_labels)}")
+        elif instr_type == 'U':
+            lines.append(f"    {mnemonic} {reg()}, 0x{rng.randint(0, 0xFFFFF):x}")
+        else:
+            lines.append(f"    {mnemonic} {reg()}, L{rng.randrange(num_labels)}    // J-type")
+    return lines
+
+
+def bench_assembler(num_lines=200000, repeat=3, one_pass=False):
+    """返回 (源代码行数, 最佳耗时秒数, 行/秒)"""
+    lines = generate_program(num_lines)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if one_pass:
+            assembler.single_pass(lines)
+        else:
+            symbol_table, _ = assembler.first_pass(lines)
+            assembler.second_pass(lines, symbol_table)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines), best, len(lines) / best
+
+
+def bench_simulator(program, max_instructions=200000, repeat=3, blocks=False, fast_forward=False):
+    """
+    在 src/C/<program>/<program>.txt 上执行最多 max_instructions 条指令 (blocks 为 True 时使用块执行模式)，
+    返回 (指令数, 最佳耗时秒数, 指令/秒)。默认关闭空转循环快进，测量的是逐条解释执行的速度
+    """
+    from devices import NullSink
+    from simulator import Simulator32Bit
+
+    with open(os.path.join(SRC_DIR, 'C', program, program + '.txt'), 'r', encoding='utf-8') as f:
+        result = assembler.assemble_text(f.read())
+    best = None
+    # 外设输出直接丢弃；复位/加载时的提示信息也不打印
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            sim = Simulator32Bit(io_sink=NullSink())
+            sim.fast_forward = fast_forward
+            sim.load_program(result.words, result.line_map)
+            start = time.perf_counter()
+            count = sim.run(max_instructions, blocks=blocks).instructions
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return count, best, count / best
+
+
+if __name__ == '__main__':
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    for label, one_pass in (("两遍", False), ("单遍", True)):
+        total, seconds, rate = bench_assembler(num_lines, one_pass=one_pass)
+        print(f"汇编器 ({label}): {total} 行, 最佳耗时 {seconds:.3f} s, {rate:,.0f} 行/秒")
+    for program in SIM_PROGRAMS:
+        for label, blocks in (("单步", False), ("块", True)):
+            count, seconds, rate = bench_simulator(program, blocks=blocks)
+            print(f"模拟器 ({program}, {label}): {count} 条指令, 最佳耗时 {seconds:.3f} s, {rate:,.0f} 指令/秒")
@@ -0,0 +1,261 @@
+import io
+import re
+import sys
+from collections import deque, namedtuple
+
+from simulator import STOP_MAX_INSTRUCTIONS
+from tracefile import TRACE_MAGIC, TraceWriter, read_trace
+
+# ==============================================================================
+# 与硬件 (RTL) 的差分协同仿真
+# 单周期 CPU 每个周期提交一条指令。Verilog testbench 每个周期输出一行提交日志，
+# 这里让 Simulator32Bit 与日志逐条同步执行，报告第一处不一致以及之前的若干条记录。
+#
+# 日志每行: PC (十六进制)、写回的寄存器 rd (十进制或 x5 形式，0 表示这条指令不写回)、写回的值 (十六进制)，如
+#   $fdisplay(f, "%08h %0d %08h", pc, wb_en ? rd : 5'd0, wb_data);   ->   00000010 5 0000002a
+# 也可以写成 pc=... rd=... value=... (键名见 _FIELD_KEYS)；数值可以带 0x 或 32'h 前缀；# 与 // 之后是注释。
+# testbench 还输出其他内容时，给日志行加一个固定前缀 (如 "COMMIT ")，用 --prefix 只读取这些行。
+# 参考一侧也可以是 tracefile.py 格式的二进制轨迹 (按文件开头的魔数识别)，例如另一个版本模拟器的轨迹。
+#
+# 两侧都按流处理: 日志逐行读取；模拟器在记录轨迹的快速路径上一次执行 batch 条指令，记录留在内存中直接比较。
+# 任何时候只保留一批记录和最近 context 条对照结果，百万周期的日志也不需要整个读进内存。
+# 每批开始时保存一个快照 (只复制改写过的页)，结束时从快照重新执行到对照停止的位置:
+# 发现不一致时模拟器停在出错指令执行之前，可以直接查看寄存器和内存。
+# 用法: python src/cosim.py program.txt commit.log [--prefix COMMIT] [--context 8]   (日志为 - 时从标准输入读取)
+# ==============================================================================
+DEFAULT_CONTEXT = 8
+DEFAULT_BATCH = 10_000
+
+COSIM_MATCH = 'match'              # 日志中的每一条都与模拟器一致
+COSIM_DIVERGED = 'diverged'        # 出现不一致 (divergence 中有详细信息)
+COSIM_SIM_STOPPED = 'sim_stopped'  # 日志还没有结束，模拟器已经停机或出错
+
+# 一条提交记录: rd 为 0 时没有写回，value 不参与比较
+Commit = namedtuple('Commit', ['pc', 'rd', 'value'])
+
+# 一次对照: index 为指令序号 (从 0 起); line 为日志行号 (二进制轨迹为记录序号);
+# expected/actual 为日志与模拟器的 Commit (模拟器已停止时 actual 为 None); instr 为模拟器执行的指令字
+Comparison = namedtuple('Comparison', ['index', 'line', 'expected', 'actual', 'instr'])
+
+# status: COSIM_*; compared: 一致的条数; divergence: 第一处不一致的 Comparison (没有则为 None);
+# context: 之前最近的若干条 Comparison; error_message: 模拟器出错时的信息
+CosimResult = namedtuple('CosimResult', ['status', 'compared', 'divergence', 'context', 'error_message'])
+
+_FIELD_KEYS = {'pc': 'pc', 'rd': 'rd', 'value': 'value', 'val': 'value', 'data': 'value', 'wdata': 'value',
+               'wb_data': 'value'}
+_KEY_VALUE = re.compile(r'(\w+)\s*[=:]\s*(\S+)')
+_COMMENT = re.compile(r'#|//')
+
+
+class CommitLogError(ValueError):
+    """提交日志中有无法解析的行"""
+
+
+def _parse_number(text, base):
+    try:
+        return int(text, base) # 最常见的情况: 不带前缀的数字 (int 本身也接受 0x 前缀和下划线)
+    except ValueError:
+        pass
+    text = text.strip(',;').lower()
+    if "'" in text: # Verilog 字面量: 32'h10, 5'd3
+        _, _, text = text.partition("'")
+        base = {'h': 16, 'd': 10, 'b': 2, 'o': 8}[text[:1]]
+        text = text[1:]
+    elif text.startswith('0x'):
+        base, text = 16, text[2:]
+    return int(text, base)
+
+
+def parse_commit_line(text):
+    """解析一行提交日志，返回 Commit；空行和注释行返回 None，无法解析时抛出 ValueError"""
+    if '#' in text or '/' in text:
+        text = _COMMENT.split(text, 1)[0]
+    if '=' in text or ':' in text:
+        fields = {_FIELD_KEYS[key.lower()]: value for key, value in _KEY_VALUE.findall(text)
+                  if key.lower() in _FIELD_KEYS}
+        if 'pc' not in fields:
+            raise ValueError("缺少 pc 字段")
+        pc_text, rd_text, value_text = fields['pc'], fields.get('rd', '0'), fields.get('value', '0')
+    else:
+        tokens = text.replace(',', ' ').split()
+        if not tokens:
+            return None
+        if len(tokens) < 3:
+            raise ValueError("需要 PC、rd、写回值三个字段")
+        pc_text, rd_text, value_text = tokens[:3]
+    pc = _parse_number(pc_text, 16)
+    rd = _parse_number(rd_text[1:], 10) if rd_text[:1] in 'xX' else _parse_number(rd_text, 10)
+    if not 0 <= rd <= 31:
+        raise ValueError(f"寄存器号超出范围: {rd}")
+    value = _parse_number(value_text, 16) if rd else 0
+    return Commit(pc & 0xFFFFFFFF, rd, value & 0xFFFFFFFF)
+
+
+def parse_commit_lines(lines, prefix=None):
+    """逐行解析文本提交日志 (任意可迭代的行)，逐条产生 (行号, Commit)；给出 prefix 时只读取以它开头的行"""
+    for number, text in enumerate(lines, 1):
+        if prefix is not None:
+            if not text.startswith(prefix):
+                continue
+            text = text[len(prefix):]
+        try:
+            commit = parse_commit_line(text)
+        except (ValueError, KeyError) as e:
+            raise CommitLogError(f"第 {number} 行无法解析 ({e}): {text.strip()}") from None
+        if commit is not None:
+            yield number, commit
+
+
+def read_commit_log(path, prefix=None):
+    """流式读取参考一侧的文件: 文本提交日志或二进制轨迹，逐条产生 (行号, Commit)"""
+    with open(path, 'rb') as f:
+        binary = f.read(len(TRACE_MAGIC)) == TRACE_MAGIC
+    if binary:
+        for number, record in enumerate(read_trace(path), 1):
+            yield number, Commit(record.pc, record.rd, record.rd_value if record.rd else 0)
+        return
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        yield from parse_commit_lines(f, prefix)
+
+
+def cosimulate(sim, reference, context=DEFAULT_CONTEXT, batch=DEFAULT_BATCH):
+    """
+    让 sim (已加载程序，处于起始状态) 与 reference ((行号, Commit) 序列) 逐条对照，
+    直到日志结束、出现不一致或模拟器停止。返回时 sim 停在最后一条一致的指令之后 (即出错指令执行之前)。
+    对照期间占用 sim.trace，结束后恢复原来的值；模拟器中重新执行的那一段会再次产生外设输出
+    """
+    reference = iter(reference)
+    history = deque(maxlen=context)
+    trace = TraceWriter(io.BytesIO(), buffer_records=batch + 1) # 一批之内不会写出，记录全部留在 buffer 中
+    saved_trace = sim.trace
+    index = 0
+
+    def finish(status, start, consumed, divergence=None):
+        # 从这一批开始时的快照重新执行 consumed 条，回到对照停止的位置
+        sim.trace = None
+        sim.restore(start)
+        if consumed:
+            sim.run(consumed)
+        return CosimResult(status, index, divergence, list(history), sim.error_message)
+
+    try:
+        while True:
+            start = sim.snapshot()
+            sim.trace = trace
+            result = sim.run(batch)
+            records = trace.drain()
+            for i in range(0, len(records), 6):
+                pc, instr, info, rd_value = records[i:i + 4]
+                rd = info & 0x1F
+                actual = Commit(pc, rd, rd_value if rd else 0)
+                entry = next(reference, None)
+                if entry is None:
+                    return finish(COSIM_MATCH, start, i // 6)
+                line, expected = entry
+                comparison = Comparison(index, line, expected, actual, instr)
+                if expected != actual:
+                    return finish(COSIM_DIVERGED, start, i // 6, comparison)
+                history.append(comparison)
+                index += 1
+            if result.reason != STOP_MAX_INSTRUCTIONS:
+                entry = next(reference, None)
+                if entry is None:
+                    return CosimResult(COSIM_MATCH, index, None, list(history), sim.error_message)
+                line, expected = entry
+                return CosimResult(COSIM_SIM_STOPPED, index, Comparison(index, line, expected, None, None),
+                                   list(history), sim.error_message)
+    finally:
+        sim.trace = saved_trace
+
+
+def _describe(commit):
+    if commit.rd:
+        return f"{commit.pc:08X}  x{commit.rd:<2} = 0x{commit.value:08X}"
+    return f"{commit.pc:08X}  --"
+
+
+def format_result(result):
+    """把 CosimResult 排成可打印的多行文本"""
+    from disassembler import disassemble_instruction
+
+    if result.status == COSIM_MATCH:
+        return f"一致: 共对照 {result.compared} 条指令"
+    lines = [f"{'序号':>10} {'行号':>10}  {'日志 (RTL)':<30} {'模拟器':<30} 指令"]
+
+    def row(comparison, mark):
+        actual = _describe(comparison.actual) if comparison.actual is not None else '(已停止)'
+        instr = disassemble_instruction(f"{comparison.instr:032b}") if comparison.instr is not None else ''
+        lines.append(f"{mark}{comparison.index:>9} {comparison.line:>10}  {_describe(comparison.expected):<30} "
+                     f"{actual:<30} {instr}")
+
+    for comparison in result.context:
+        row(comparison, ' ')
+    divergence = result.divergence
+    row(divergence, '>')
+    if result.status == COSIM_SIM_STOPPED:
+        header = f"模拟器在第 {divergence.index} 条指令之前停止，日志第 {divergence.line} 行还有后续提交"
+        if result.error_message:
+            header += f"\n{result.error_message}"
+    else:
+        expected, actual = divergence.expected, divergence.actual
+        if expected.pc != actual.pc:
+            what = "PC"
+        elif expected.rd != actual.rd:
+            what = "写回的寄存器"
+        else:
+            what = "写回的值"
+        header = f"第 {divergence.index} 条指令 (日志第 {divergence.line} 行) {what}不一致"
+    return header + '\n' + '\n'.join(lines)
+
+
+def main(argv=None):
+    """命令行入口，返回进程退出码 (一致为 0，不一致为 1，输入有误为 2)"""
+    import argparse
+    from assembler import assemble_text
+    from devices import NullSink
+    from loader import ImageError, load_image_file
+    from simulator import DEFAULT_CPU_HZ, Simulator32Bit
+
+    parser = argparse.ArgumentParser(description='与 RTL 提交日志逐条对照的协同仿真')
+    parser.add_argument('program', help='汇编源文件，或 GCC 生成的 .bin/.elf 程序映像')
+    parser.add_argument('log', help='提交日志 (文本，每行 PC rd 写回值) 或二进制执行轨迹；- 表示标准输入')
+    parser.add_argument('--prefix', help='只读取以该前缀开头的日志行')
+    parser.add_argument('--context', type=int, default=DEFAULT_CONTEXT, help='报告中显示不一致之前的条数')
+    parser.add_argument('--cpu-hz', type=int, default=DEFAULT_CPU_HZ, help='硬件的时钟频率 (Hz，影响 Timer)')
+    parser.add_argument('--regs', action='store_true', help='不一致时打印模拟器在出错指令之前的全部寄存器')
+    args = parser.parse_args(argv)
+
+    sim = Simulator32Bit(io_sink=NullSink(), cpu_hz=args.cpu_hz)
+    if args.program.lower().endswith(('.bin', '.elf')):
+        try:
+            sim.load_image(load_image_file(args.program))
+        except ImageError as e:
+            print(f"错误: {e}")
+            return 2
+    else:
+        with open(args.program, 'r', encoding='utf-8') as f:
+            assembled = assemble_text(f.read())
+        if assembled.errors:
+            print("汇编过程中发现错误:")
+            for e in assembled.errors: print(f"- {e}")
+            return 2
+        sim.load_program(assembled.words, assembled.line_map)
+
+    if args.log == '-':
+        reference = parse_commit_lines(sys.stdin, args.prefix)
+    else:
+        reference = read_commit_log(args.log, args.prefix)
+    try:
+        result = cosimulate(sim, reference, context=args.context)
+    except ValueError as e: # CommitLogError 或二进制轨迹文件损坏
+        print(f"错误: {e}")
+        return 2
+    print(format_result(result))
+    if result.status != COSIM_MATCH and args.regs:
+        for i in range(0, 32, 4):
+            print('  '.join(f"x{j:<2}=0x{sim.registers[j]:08X}" for j in range(i, i + 4)))
+    return 0 if result.status == COSIM_MATCH else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
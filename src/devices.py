@@ -0,0 +1,254 @@
+import copy
+import sys
+
+# ==============================================================================
+# 外设框架
+# 每个外设是一个对象，通过 Simulator32Bit.attach_device(base, device) 挂到总线的
+# [base, base + device.size) 地址范围上；总线只负责按地址分派，寄存器语义全部在外设里。
+#
+#   read(offset, num_bytes, signed)   -> 读到的值 (offset 相对 base)
+#   write(offset, value, num_bytes)   -> True 表示已处理，False 表示该偏移不可写 (总线报告无效地址)
+#   tick(cycles)                      -> 推进 cycles 个周期 (只在子类重写了 tick 时才会被调用)
+#   next_event(cycle)                 -> cycle 之后外设可读状态第一次自行变化的周期，不会变化则为 None
+#   reset()                           -> 恢复上电状态
+#   save_state() / load_state(state)  -> 保存/恢复外设状态 (Simulator32Bit.snapshot/restore 使用)
+#   write_undo_state() / undo_write(state) -> 撤销一次写操作所需的最小状态 (撤销日志每次写外设都保存一份)
+#
+# 外设状态每被读写改变一次都要调用 changed()；模拟器据此 (以及 next_event) 判断一段循环是否在空转。
+# 需要当前时间的外设通过 bus.current_cycle() 与 bus.cpu_hz 按需推算，不必每个周期 tick。
+#
+# 外设产生的输出 (UART 发送、GPIO 变化) 写入输出槽 (sink)，不直接 print；
+# 默认的 BufferedSink 攒满一批或调用 flush() 时才一次性写到流中。
+# ==============================================================================
+
+
+class BufferedSink:
+    """
+    外设输出的缓冲槽: emit() 只追加到列表，攒满 capacity 行或调用 flush() 时一次性写出。
+    stream 为 None 时写到当时的 sys.stdout (因此 contextlib.redirect_stdout 仍然有效)。
+    """
+    def __init__(self, stream=None, capacity=4096):
+        self.stream = stream
+        self.capacity = capacity
+        self.lines = []
+
+    def emit(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            lines, self.lines = self.lines, []
+            stream = self.stream if self.stream is not None else sys.stdout
+            stream.write('\n'.join(lines) + '\n')
+
+    def drain(self):
+        """取走尚未写出的全部行 (不写到流中)"""
+        lines, self.lines = self.lines, []
+        return lines
+
+
+class NullSink:
+    """丢弃全部输出 (基准测试、批量回归时使用)"""
+    def emit(self, line):
+        pass
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        return []
+
+
+_UNSAVED_ATTRIBUTES = ('sink', 'base', 'bus')
+
+
+class Device:
+    """外设基类；base 在挂到总线时由 attach_device 设置"""
+    name = 'device'
+    size = 4
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else NullSink()
+        self.base = None
+        self.bus = None # 挂到总线上的 Simulator32Bit
+        self.version = 0
+
+    def read(self, offset, num_bytes, signed):
+        raise MemoryError(f"Read from unmapped or invalid address 0x{self.base + offset:X}")
+
+    def write(self, offset, value, num_bytes):
+        return False
+
+    def changed(self):
+        """外设状态发生了变化 (由子类在 read/write 中调用)"""
+        self.version += 1
+        if self.bus is not None:
+            self.bus.device_version += 1
+
+    def tick(self, cycles):
+        pass
+
+    def next_event(self, cycle):
+        return None
+
+    def reset(self):
+        pass
+
+    def save_state(self):
+        """外设状态的副本；默认复制除总线连接和输出槽以外的全部属性 (bytearray 等可变对象复制一份)"""
+        return {key: copy.copy(value) for key, value in vars(self).items() if key not in _UNSAVED_ATTRIBUTES}
+
+    def load_state(self, state):
+        for key, value in state.items():
+            setattr(self, key, copy.copy(value)) # 状态可能被恢复多次，不能与快照共用可变对象
+
+    def write_undo_state(self):
+        """写操作之前调用，返回 undo_write() 需要的状态；默认为完整的 save_state()，状态会随运行增长的外设应重写"""
+        return self.save_state()
+
+    def undo_write(self, state):
+        self.load_state(state)
+
+    def _word_bytes(self, reg_val, offset, num_bytes, signed, check_alignment=True):
+        # 根据请求的字节数和偏移量返回正确的字节
+        address = self.base + offset
+        byte_offset_in_word = address % 4
+        if num_bytes == 4 and byte_offset_in_word == 0: # 最常见的对齐字访问
+            return reg_val - ((reg_val & 0x80000000) << 1) if signed else reg_val
+        val_bytes = reg_val.to_bytes(4, 'little', signed=False)
+
+        if num_bytes == 1:
+            return int.from_bytes(val_bytes[byte_offset_in_word:byte_offset_in_word+1], 'little', signed=signed)
+        elif num_bytes == 2:
+            if check_alignment and byte_offset_in_word > 2: raise MemoryError(f"Unaligned 2-byte read at 0x{address:X}")
+            return int.from_bytes(val_bytes[byte_offset_in_word:byte_offset_in_word+2], 'little', signed=signed)
+        elif num_bytes == 4:
+            if check_alignment and byte_offset_in_word != 0: raise MemoryError(f"Unaligned 4-byte read at 0x{address:X}")
+            return int.from_bytes(val_bytes, 'little', signed=signed)
+
+
+class Timer(Device):
+    """
+    Timer: 偏移 0 处一个只读的 32 位无符号计数器，复位后以 tick_hz (默认 1 kHz，即毫秒) 递增。
+    计数值不随每条指令更新，而是读取时由总线的当前周期数换算: cycle * tick_hz // cpu_hz。
+    """
+    name = 'timer'
+    size = 0x04
+
+    def __init__(self, sink=None, tick_hz=1000):
+        super().__init__(sink)
+        self.tick_hz = tick_hz
+
+    def ticks_at(self, cycle):
+        return cycle * self.tick_hz // self.bus.cpu_hz
+
+    @property
+    def counter(self):
+        if self.bus is None:
+            return 0
+        return self.ticks_at(self.bus.current_cycle()) & 0xFFFFFFFF
+
+    def read(self, offset, num_bytes, signed):
+        return self._word_bytes(self.counter, offset, num_bytes, signed)
+
+    def next_event(self, cycle):
+        # 计数值下一次加 1 的周期: 满足 c * tick_hz >= (ticks + 1) * cpu_hz 的最小 c
+        cpu_hz = self.bus.cpu_hz
+        return -(-(self.ticks_at(cycle) + 1) * cpu_hz // self.tick_hz)
+
+
+class UART(Device):
+    """
+    UART (根据PPT，寄存器偏移 0x00 到 0x10):
+    0x00 ctrl, 0x04 status (0 = 空闲, 允许发送), 0x08 baud, 0x0C txdata, 0x10 rxdata。
+    写 txdata 时发送一个字节: 记入 tx_bytes 并向输出槽发出一行 "UART_TX: n"。
+    """
+    name = 'uart'
+    size = 0x14
+
+    def __init__(self, sink=None):
+        super().__init__(sink)
+        self.reset()
+
+    def reset(self):
+        self.ctrl = 0
+        self.status = 0
+        self.baud = 0
+        self.txdata = 0
+        self.rxdata = 0
+        self.tx_bytes = bytearray() # 复位以来发送的全部字节
+
+    def registers(self):
+        return (self.ctrl, self.status, self.baud, self.txdata, self.rxdata)
+
+    def write_undo_state(self):
+        # 只记可写的寄存器和已发送的字节数，撤销时截断 tx_bytes，不复制整个发送记录
+        return self.ctrl, self.baud, self.txdata, len(self.tx_bytes)
+
+    def undo_write(self, state):
+        self.ctrl, self.baud, self.txdata, sent = state
+        del self.tx_bytes[sent:]
+
+    def read(self, offset, num_bytes, signed):
+        # 模拟读取UART寄存器；偏移不要求对齐
+        reg_val = self.registers()[offset >> 2]
+        return self._word_bytes(reg_val, offset, num_bytes, signed, check_alignment=False)
+
+    def write(self, offset, value, num_bytes):
+        # 模拟写入UART寄存器；status 与 rxdata 只读
+        if offset == 0x00:
+            if value != self.ctrl: self.ctrl = value; self.changed()
+            return True
+        elif offset == 0x08:
+            if value != self.baud: self.baud = value; self.changed()
+            return True
+        elif offset == 0x0C: # UART_TXDATA [cite: 226]；每次写都发送一个字节
+            self.txdata = value & 0xFF
+            self.tx_bytes.append(self.txdata)
+            self.changed()
+            self.sink.emit(f"UART_TX: {self.txdata}")
+            return True
+        return False
+
+
+class GPIO(Device):
+    """
+    GPIO (根据PPT，寄存器按字节偏移 0x00 到 0x07) [cite: 217-222]:
+    偏移 0 = leds，偏移 1..7 = 数码管 smg[1..7]。写入的值与原来不同时向输出槽发出一行新状态。
+    """
+    name = 'gpio'
+    size = 0x08
+
+    def __init__(self, sink=None):
+        super().__init__(sink)
+        self.reset()
+
+    def reset(self):
+        self.leds = 0
+        self.smgs = bytearray(8) # (偏移 0x1-0x7)
+
+    def read(self, offset, num_bytes, signed):
+        smgs = self.smgs
+        if offset < 0x04:
+            # 第一个字: LSB = leds, 之后依次为 smg[1..3]
+            reg_val_word = (smgs[3] << 24) | (smgs[2] << 16) | (smgs[1] << 8) | self.leds
+        else:
+            # 第二个字: smg[4..7]
+            reg_val_word = (smgs[7] << 24) | (smgs[6] << 16) | (smgs[5] << 8) | smgs[4]
+        return self._word_bytes(reg_val_word, offset, num_bytes, signed)
+
+    def write(self, offset, value, num_bytes):
+        # 无论访问宽度，只写入最低字节
+        value_byte = value & 0xFF
+        if offset == 0x00:
+            if value_byte != self.leds:
+                self.leds = value_byte
+                self.changed()
+                self.sink.emit(f"GPIO_LEDS: {value_byte:08b}")
+        elif value_byte != self.smgs[offset]:
+            self.smgs[offset] = value_byte
+            self.changed()
+            self.sink.emit(f"GPIO_SMG[{offset}]: {value_byte:X}")
+        return True
@@ -1,73 +1,9 @@
 import os
 import sys
 
-# --- 1. 核心映射表 (保留原脚本逻辑) ---
-REGISTER_MAP = {
-    'x0': 0, 'zero': 0, 'r0': 0, 'x1': 1, 'ra': 1, 'r1': 1, 'x2': 2, 'sp': 2,
-    'x3': 3, 'gp': 3, 'x4': 4, 'tp': 4, 'x5': 5, 't0': 5, 'x6': 6, 't1': 6,
-    'x7': 7, 't2': 7, 'x8': 8, 's0': 8, 'fp': 8, 'x9': 9, 's1': 9, 'x10': 10, 'a0': 10,
-    'x11': 11, 'a1': 11, 'x12': 12, 'a2': 12, 'x13': 13, 'a3': 13, 'x14': 14, 'a4': 14,
-    'x15': 15, 'a5': 15, 'x16': 16, 'a6': 16, 'x17': 17, 'a7': 17, 'x18': 18, 's2': 18,
-    'x19': 19, 's3': 19, 'x20': 20, 's4': 20, 'x21': 21, 's5': 21, 'x22': 22, 's6': 22,
-    'x23': 23, 's7': 23, 'x24': 24, 's8': 24, 'x25': 25, 's9': 25, 'x26': 26, 's10': 26,
-    'x27': 27, 's11': 27, 'x28': 28, 't3': 28, 'x29': 29, 't4': 29, 'x30': 30, 't5': 30,
-    'x31': 31, 't6': 31
-}
-
-# 增加了 csrrw 等指令的支持，以防万一
-INSTRUCTION_MAP = {
-    'add': {'type': 'R', 'opcode': '0110011', 'funct3': '000', 'funct7': '0000000'},
-    'sub': {'type': 'R', 'opcode': '0110011', 'funct3': '000', 'funct7': '0100000'},
-    'sll': {'type': 'R', 'opcode': '0110011', 'funct3': '001', 'funct7': '0000000'},
-    'slt': {'type': 'R', 'opcode': '0110011', 'funct3': '010', 'funct7': '0000000'},
-    'sltu': {'type': 'R', 'opcode': '0110011', 'funct3': '011', 'funct7': '0000000'},
-    'xor': {'type': 'R', 'opcode': '0110011', 'funct3': '100', 'funct7': '0000000'},
-    'srl': {'type': 'R', 'opcode': '0110011', 'funct3': '101', 'funct7': '0000000'},
-    'sra': {'type': 'R', 'opcode': '0110011', 'funct3': '101', 'funct7': '0100000'},
-    'or': {'type': 'R', 'opcode': '0110011', 'funct3': '110', 'funct7': '0000000'},
-    'and': {'type': 'R', 'opcode': '0110011', 'funct3': '111', 'funct7': '0000000'},
-    'mul': {'type': 'R', 'opcode': '0110011', 'funct3': '000', 'funct7': '0000001'},
-    'mulh': {'type': 'R', 'opcode': '0110011', 'funct3': '001', 'funct7': '0000001'},
-    'mulhsu': {'type': 'R', 'opcode': '0110011', 'funct3': '010', 'funct7': '0000001'},
-    'mulhu': {'type': 'R', 'opcode': '0110011', 'funct3': '011', 'funct7': '0000001'},
-    'div': {'type': 'R', 'opcode': '0110011', 'funct3': '100', 'funct7': '0000001'},
-    'divu': {'type': 'R', 'opcode': '0110011', 'funct3': '101', 'funct7': '0000001'},
-    'rem': {'type': 'R', 'opcode': '0110011', 'funct3': '110', 'funct7': '0000001'},
-    'remu': {'type': 'R', 'opcode': '0110011', 'funct3': '111', 'funct7': '0000001'},
-    'addi': {'type': 'I', 'opcode': '0010011', 'funct3': '000'},
-    'slti': {'type': 'I', 'opcode': '0010011', 'funct3': '010'},
-    'sltiu': {'type': 'I', 'opcode': '0010011', 'funct3': '011'},
-    'xori': {'type': 'I', 'opcode': '0010011', 'funct3': '100'},
-    'ori': {'type': 'I', 'opcode': '0010011', 'funct3': '110'},
-    'andi': {'type': 'I', 'opcode': '0010011', 'funct3': '111'},
-    'slli': {'type': 'I-shift', 'opcode': '0010011', 'funct3': '001'},
-    'srli': {'type': 'I-shift', 'opcode': '0010011', 'funct3': '101', 'funct7': '0000000'},
-    'srai': {'type': 'I-shift', 'opcode': '0010011', 'funct3': '101', 'funct7': '0100000'},
-    'lb': {'type': 'I-load', 'opcode': '0000011', 'funct3': '000'},
-    'lh': {'type': 'I-load', 'opcode': '0000011', 'funct3': '001'},
-    'lw': {'type': 'I-load', 'opcode': '0000011', 'funct3': '010'},
-    'lbu': {'type': 'I-load', 'opcode': '0000011', 'funct3': '100'},
-    'lhu': {'type': 'I-load', 'opcode': '0000011', 'funct3': '101'},
-    'jalr': {'type': 'I-jalr', 'opcode': '1100111', 'funct3': '000'},
-    'sb': {'type': 'S', 'opcode': '0100011', 'funct3': '000'},
-    'sh': {'type': 'S', 'opcode': '0100011', 'funct3': '001'},
-    'sw': {'type': 'S', 'opcode': '0100011', 'funct3': '010'},
-    'beq': {'type': 'B', 'opcode': '1100011', 'funct3': '000'},
-    'bne': {'type': 'B', 'opcode': '1100011', 'funct3': '001'},
-    'blt': {'type': 'B', 'opcode': '1100011', 'funct3': '100'},
-    'bge': {'type': 'B', 'opcode': '1100011', 'funct3': '101'},
-    'bltu': {'type': 'B', 'opcode': '1100011', 'funct3': '110'},
-    'bgeu': {'type': 'B', 'opcode': '1100011', 'funct3': '111'},
-    'lui': {'type': 'U', 'opcode': '0110111'},
-    'auipc': {'type': 'U', 'opcode': '0010111'},
-    'jal': {'type': 'J', 'opcode': '1101111'},
-}
-
-REVERSE_MAP = {}
-for name, details in INSTRUCTION_MAP.items():
-    key = (details['opcode'], details.get('funct3'), details.get('funct7'))
-    REVERSE_MAP[key] = {'mnemonic': name, 'type': details['type']}
+from assembler import REGISTER_MAP, lookup_instruction
 
+# --- 1. 核心映射表 (指令表与 assembler.py 共用，这里只保留反汇编显示用的 ABI 名称) ---
 ABI_MAP = {v: k for k, v in REGISTER_MAP.items() if 'x' not in k and 'r' not in k and k not in ('zero', 'fp')}
 ABI_MAP[0] = 'zero'
 
@@ -138,13 +74,11 @@ def disassemble_instruction(code_bin_str):
     funct3 = code_bin_str[17:20]
     funct7 = code_bin_str[0:7]
 
-    details = REVERSE_MAP.get((opcode, funct3, funct7))
-    if not details: details = REVERSE_MAP.get((opcode, funct3, None))
-    if not details: details = REVERSE_MAP.get((opcode, None, None))
-
-    if not details:
+    found = lookup_instruction(int(code_bin_str, 2))
+    if not found:
         # 即使无法解码，也显示出 opcode 方便调试
         return f"UNKNOWN_INSTRUCTION (Op: {opcode}, F3: {funct3}, F7: {funct7})"
+    details = {'mnemonic': found[0], 'type': found[1]['type']}
 
     handler_map = {
         'R': disassemble_r_type, 'I': disassemble_i_type, 'I-shift': disassemble_i_type,
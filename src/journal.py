@@ -0,0 +1,127 @@
+from collections import deque, namedtuple
+
+from devices import NullSink
+from simulator import PAGE_SHIFT
+
+# ==============================================================================
+# 撤销日志 (反向单步)
+# 开启后 (Simulator32Bit.enable_journal)，step() 在执行每条指令之前记下撤销它所需的信息 (UndoEntry)，
+# 放进容量固定的环形缓冲区；另外每隔 checkpoint_interval 条指令用 Simulator32Bit.snapshot() 保存一个检查点。
+#
+#   后退一步: 缓冲区里有记录时直接按记录撤销；没有记录时 (超出了缓冲区，或者刚刚用 run() 快速运行过)
+#             恢复到最近的检查点，逐条重新执行到当前位置之前一条，同时把这一段重新记入缓冲区。
+#   反向运行: 反复后退，直到 PC 落在断点上。
+#
+# 内存上限: 最多 capacity 条记录 (每条约 100~200 字节) 加 max_checkpoints 个检查点
+# (每个检查点只复制与上一个检查点之间改写过的 4 KiB 页)，更早的记录和检查点被丢弃，无法再后退到那里。
+# ==============================================================================
+DEFAULT_CAPACITY = 100_000
+DEFAULT_CHECKPOINT_INTERVAL = 10_000
+DEFAULT_MAX_CHECKPOINTS = 64
+
+# 一条指令执行之前的状态: pc/previous_pc/instret 恢复原值，寄存器 rd 恢复为 old_value；
+# store 为 None (不写内存)、(地址, 字节数, 原值) (写 ROM/RAM) 或 (地址, 外设, Device.write_undo_state()) (写外设)
+UndoEntry = namedtuple('UndoEntry', ['pc', 'previous_pc', 'instret', 'rd', 'old_value', 'store'])
+
+# 执行函数名 -> 写内存的字节数
+_STORE_SIZES = {'_op_sb': 1, '_op_sh': 2, '_op_sw': 4}
+
+
+class ExecutionJournal:
+    def __init__(self, capacity=DEFAULT_CAPACITY, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 max_checkpoints=DEFAULT_MAX_CHECKPOINTS):
+        self.checkpoint_interval = checkpoint_interval
+        self.paused = False # 为 True 时 step() 不记录 (Simulator32Bit._run_checkpointed 连续运行期间)
+        self.entries = deque(maxlen=capacity)            # UndoEntry，最后一条对应最近执行的指令
+        self.checkpoints = deque(maxlen=max_checkpoints) # MachineState，按 instret 递增
+
+    def clear(self):
+        """丢弃全部历史 (复位、加载程序、恢复快照之后，旧的历史不再与当前状态衔接)"""
+        self.entries.clear()
+        self.checkpoints.clear()
+
+    def checkpoint_due(self, instret):
+        return not self.checkpoints or instret - self.checkpoints[-1].instret >= self.checkpoint_interval
+
+    def checkpoint(self, sim):
+        self.checkpoints.append(sim.snapshot())
+
+    def record(self, sim, decoded, previous_pc):
+        """sim.step() 在执行 decoded 之前调用；previous_pc 为执行之前的 sim.previous_pc"""
+        if self.checkpoint_due(sim.instret):
+            # step() 已经把 previous_pc 改成了当前 PC，检查点中要保存执行之前的值
+            self.checkpoints.append(sim.snapshot()._replace(previous_pc=previous_pc))
+        handler, rd, rs1, rs2, imm, _ = decoded
+        registers = sim.registers
+        store = None
+        num_bytes = _STORE_SIZES.get(handler.__name__)
+        if num_bytes is not None:
+            address = (registers[rs1] + imm) & 0xFFFFFFFF
+            store = self._old_contents(sim, address, num_bytes)
+        self.entries.append(UndoEntry(sim.pc, previous_pc, sim.instret, rd, registers[rd], store))
+
+    def _old_contents(self, sim, address, num_bytes):
+        if address >> PAGE_SHIFT in sim.mem_pages:
+            try:
+                return address, num_bytes, sim.mem_read(address, num_bytes)
+            except MemoryError:
+                return None # 越界，写操作本身也会出错
+        for region in sim.mmio_pages.get(address >> PAGE_SHIFT, ()):
+            if region.start <= address < region.end:
+                return address, region.device, region.device.write_undo_state()
+        return None
+
+    def undo(self, sim):
+        """撤销最后一条记录对应的指令"""
+        entry = self.entries.pop()
+        store = entry.store
+        if store is not None:
+            address, target, old = store
+            if isinstance(target, int):
+                sim.mem_write(address, old, target)
+            else:
+                target.undo_write(old)
+                target.changed()
+        if entry.rd:
+            sim.registers[entry.rd] = entry.old_value
+        self._move_to(sim, entry.pc, entry.previous_pc, entry.instret)
+
+    def _move_to(self, sim, pc, previous_pc, instret):
+        sim.pc = pc
+        sim.previous_pc = previous_pc
+        sim.instret = instret
+        sim.ticked_instret = min(sim.ticked_instret, instret)
+        sim.halted = False # 指令只会在未停机时执行
+        sim.error_message = None
+        checkpoints = self.checkpoints
+        while checkpoints and checkpoints[-1].instret > instret:
+            checkpoints.pop() # 回到了这些检查点之前
+
+    def step_back(self, sim):
+        """回到上一条指令执行之前的状态；已经没有更早的历史时返回 False"""
+        if self.entries:
+            self.undo(sim)
+            return True
+        # 出错/停机的那条指令没有计入 instret，回到它之前时 instret 不变
+        target = sim.instret if sim.halted else sim.instret - 1
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint.instret <= target and not checkpoint.halted:
+                break
+        else:
+            return False
+        while self.checkpoints[-1] is not checkpoint:
+            self.checkpoints.pop()
+        sim.restore(checkpoint, keep_journal=True)
+        # 从检查点重新执行到目标位置，step() 会把这一段重新记入缓冲区。
+        # 这一段的外设输出之前已经发出过，重新执行时丢弃 (外设自身的状态照常更新)
+        sinks = [(device, device.sink) for device in sim.devices]
+        muted = NullSink()
+        try:
+            for device, _ in sinks:
+                device.sink = muted
+            while sim.instret < target and sim.step():
+                pass
+        finally:
+            for device, sink in sinks:
+                device.sink = sink
+        return True
@@ -0,0 +1,93 @@
+import os
+import struct
+from collections import namedtuple
+
+# ==============================================================================
+# 程序映像加载 (.bin / ELF32)
+# 把 GCC 生成的 src/C/*/*.bin、*.elf 解析成 ProgramImage，由 Simulator32Bit.load_image()
+# 按段整块复制到 ROM/RAM (每段一次切片赋值)，不再需要先转换成 '0'/'1' 文本。
+#
+#   .bin  objcopy -O binary 的输出: 从 ROM 起始地址 (0x0) 开始的小端原始字节，入口为 0
+#   .elf  按程序头 (PT_LOAD) 加载: 文件内容放到加载地址 (LMA，os.ld 中的 AT>flash)；
+#         运行地址 (VMA) 与 LMA 不同的段 (如 .data 在 0x10000000) 再复制一份到 VMA 并把 .bss 部分清零，
+#         相当于 start.S 中搬运 .data 的那一步已经做完。入口取 e_entry，符号表取 .symtab
+# ==============================================================================
+
+# address: 段的起始地址; data: 要复制的字节
+Segment = namedtuple('Segment', ['address', 'data'])
+
+# segments: Segment 列表; entry: 入口 PC; symbols: 符号名 -> 地址
+ProgramImage = namedtuple('ProgramImage', ['segments', 'entry', 'symbols'])
+
+ELF_MAGIC = b'\x7fELF'
+EM_RISCV = 243
+PT_LOAD = 1
+SHT_SYMTAB = 2
+SHN_UNDEF = 0
+STT_SECTION, STT_FILE = 3, 4
+
+_ELF_HEADER = struct.Struct('<16sHHIIIIIHHHHHH')
+_PROGRAM_HEADER = struct.Struct('<IIIIIIII')
+_SECTION_HEADER = struct.Struct('<IIIIIIIIII')
+_SYMBOL = struct.Struct('<IIIBBH')
+
+
+class ImageError(Exception):
+    """文件不是可以加载的程序映像"""
+
+
+def load_bin(data, address=0):
+    """原始二进制: 整个文件作为一个段放在 address (默认 ROM 起始地址)"""
+    return ProgramImage([Segment(address, bytes(data))], address, {})
+
+
+def load_elf(data):
+    """解析小端 ELF32 (RISC-V) 可执行文件"""
+    data = memoryview(data)
+    if len(data) < _ELF_HEADER.size or bytes(data[:4]) != ELF_MAGIC:
+        raise ImageError("不是 ELF 文件")
+    ident, _, machine, _, entry, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum, _ = \
+        _ELF_HEADER.unpack_from(data, 0)
+    if ident[4] != 1 or ident[5] != 1:
+        raise ImageError("只支持小端 ELF32 文件")
+    if machine != EM_RISCV:
+        raise ImageError(f"不是 RISC-V 程序 (e_machine = {machine})")
+
+    segments = []
+    for i in range(phnum):
+        p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, _, _ = \
+            _PROGRAM_HEADER.unpack_from(data, phoff + i * phentsize)
+        if p_type != PT_LOAD or p_memsz == 0:
+            continue
+        contents = data[p_offset:p_offset + p_filesz]
+        if p_filesz:
+            segments.append(Segment(p_paddr, contents))
+        # 运行地址不同 (.data) 或有未初始化部分 (.bss) 时，在运行地址上放一份完整内容
+        if p_vaddr != p_paddr or p_memsz > p_filesz:
+            segments.append(Segment(p_vaddr, bytes(contents) + bytes(p_memsz - p_filesz)))
+
+    symbols = {}
+    sections = [_SECTION_HEADER.unpack_from(data, shoff + i * shentsize) for i in range(shnum)] if shoff else []
+    for _, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, sh_entsize in sections:
+        if sh_type != SHT_SYMTAB or sh_link >= len(sections):
+            continue
+        strtab_offset, strtab_size = sections[sh_link][4], sections[sh_link][5]
+        strtab = bytes(data[strtab_offset:strtab_offset + strtab_size])
+        for pos in range(sh_offset, sh_offset + sh_size, sh_entsize or _SYMBOL.size):
+            st_name, st_value, _, st_info, _, st_shndx = _SYMBOL.unpack_from(data, pos)
+            if st_name == 0 or st_shndx == SHN_UNDEF or (st_info & 0xF) in (STT_SECTION, STT_FILE):
+                continue
+            name = strtab[st_name:strtab.index(b'\0', st_name)].decode('utf-8', 'replace')
+            symbols.setdefault(name, st_value)
+    return ProgramImage(segments, entry, symbols)
+
+
+def load_image_file(path):
+    """按文件内容 (ELF 魔数) 或扩展名选择加载方式，返回 ProgramImage"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] == ELF_MAGIC:
+        return load_elf(data)
+    if os.path.splitext(path)[1].lower() == '.bin':
+        return load_bin(data)
+    raise ImageError(f"无法识别的程序映像: {path}")
@@ -0,0 +1,1754 @@
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from assembler import decode_table, words_to_le_bytes
+from devices import Device, BufferedSink, NullSink, Timer, UART, GPIO
+
+# ==============================================================================
+# 32 位 RISC-V SoC 模拟器 (ROM/RAM + Timer/UART/GPIO 外设)
+# 不依赖 tkinter，可以在没有图形界面的环境 (如 CI) 中直接导入使用；
+# windows.py 中的 GUI 只是它的一个前端。
+# ==============================================================================
+
+# ==============================================================================
+# 基本块翻译
+# 从某个 PC 开始向后扫描，直到遇到分支/jal/jalr (包含在块内) 为止，得到一个基本块；
+# 把整个块翻译成一个 Python 函数 (compile/exec)，块内用到的寄存器保存在局部变量 r<n> 中，
+# 只在进入块时读取、离开块时写回。生成的函数形如:
+#
+#   def block(sim, regs, mem_read, mem_write):
+#       r5 = regs[5]; r6 = regs[6]
+#       n = 0
+#       try:
+#           r5 = (r5 + 1) & 0xFFFFFFFF
+#           n = 1
+#           mem_write((r6 + 0) & 0xFFFFFFFF, r5, 4)
+#           n = sim.block_offset = 2         # 读内存前记下块内序号，current_cycle() 要用
+#           ...
+#       except BaseException:
+#           regs[5] = r5; sim.pc = 0x... + 4 * n   # 精确地停在出错的指令上
+#           raise
+#       regs[5] = r5
+#       return next_pc, 指令条数
+# ==============================================================================
+BLOCK_MAX_INSTRUCTIONS = 64
+BLOCK_PAGE_SHIFT = 8 # 按 256 字节的页记录块覆盖的地址范围，写内存时据此让块失效
+
+def div32(a, b):
+    """有符号除法 (输入输出均为无符号 32 位表示)，C-style 向零截断；除以 0 结果全为 1"""
+    a -= (a & 0x80000000) << 1
+    b -= (b & 0x80000000) << 1
+    if b == 0:
+        return 0xFFFFFFFF
+    # -2^31 / -1 溢出后截断为 -2^31
+    result = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        result = -result
+    return result & 0xFFFFFFFF
+
+def rem32(a, b):
+    """有符号取余，余数与被除数同号 (C-style)；除以 0 结果为被除数"""
+    a -= (a & 0x80000000) << 1
+    b -= (b & 0x80000000) << 1
+    if b == 0:
+        return a & 0xFFFFFFFF
+    result = abs(a) % abs(b)
+    if a < 0:
+        result = -result
+    return result & 0xFFFFFFFF
+
+def _signed(x):
+    return f"({x} - (({x} & 0x80000000) << 1))"
+
+# 写回 rd 的运算: 助记符 -> 表达式模板 (a = rs1, b = rs2 的无符号值, i = 立即数)
+_BLOCK_ALU = {
+    'add': lambda a, b, i: f"({a} + {b}) & 0xFFFFFFFF",
+    'sub': lambda a, b, i: f"({a} - {b}) & 0xFFFFFFFF",
+    'sll': lambda a, b, i: f"({a} << ({b} & 0x1F)) & 0xFFFFFFFF",
+    'slt': lambda a, b, i: f"1 if {_signed(a)} < {_signed(b)} else 0",
+    'sltu': lambda a, b, i: f"1 if {a} < {b} else 0",
+    'xor': lambda a, b, i: f"{a} ^ {b}",
+    'srl': lambda a, b, i: f"{a} >> ({b} & 0x1F)",
+    'sra': lambda a, b, i: f"({_signed(a)} >> ({b} & 0x1F)) & 0xFFFFFFFF",
+    'or': lambda a, b, i: f"{a} | {b}",
+    'and': lambda a, b, i: f"{a} & {b}",
+    'mul': lambda a, b, i: f"({a} * {b}) & 0xFFFFFFFF",
+    'mulh': lambda a, b, i: f"(({_signed(a)} * {_signed(b)}) >> 32) & 0xFFFFFFFF",
+    'mulhsu': lambda a, b, i: f"(({_signed(a)} * {b}) >> 32) & 0xFFFFFFFF",
+    'mulhu': lambda a, b, i: f"({a} * {b}) >> 32",
+    'div': lambda a, b, i: f"div32({a}, {b})",
+    'divu': lambda a, b, i: f"({a} // {b} if {b} else 0xFFFFFFFF)",
+    'rem': lambda a, b, i: f"rem32({a}, {b})",
+    'remu': lambda a, b, i: f"({a} % {b} if {b} else {a})",
+    'addi': lambda a, b, i: f"({a} + {i}) & 0xFFFFFFFF",
+    'slti': lambda a, b, i: f"1 if {_signed(a)} < {i} else 0",
+    'sltiu': lambda a, b, i: f"1 if {a} < {i & 0xFFFFFFFF} else 0",
+    'xori': lambda a, b, i: f"{a} ^ {i & 0xFFFFFFFF}",
+    'ori': lambda a, b, i: f"{a} | {i & 0xFFFFFFFF}",
+    'andi': lambda a, b, i: f"{a} & {i & 0xFFFFFFFF}",
+    'slli': lambda a, b, i: f"({a} << {i}) & 0xFFFFFFFF",
+    'srli': lambda a, b, i: f"{a} >> {i}",
+    'srai': lambda a, b, i: f"({_signed(a)} >> {i}) & 0xFFFFFFFF",
+}
+
+# 访存: 助记符 -> (字节数, 是否符号扩展)
+_BLOCK_LOADS = {'lb': (1, True), 'lh': (2, True), 'lw': (4, False), 'lbu': (1, False), 'lhu': (2, False)}
+_BLOCK_STORES = {'sb': 1, 'sh': 2, 'sw': 4}
+
+# 分支条件
+_BLOCK_BRANCHES = {
+    'beq': lambda a, b: f"{a} == {b}",
+    'bne': lambda a, b: f"{a} != {b}",
+    'blt': lambda a, b: f"{_signed(a)} < {_signed(b)}",
+    'bge': lambda a, b: f"{_signed(a)} >= {_signed(b)}",
+    'bltu': lambda a, b: f"{a} < {b}",
+    'bgeu': lambda a, b: f"{a} >= {b}",
+}
+
+_BLOCK_NAMESPACE = {'div32': div32, 'rem32': rem32}
+
+# ==============================================================================
+# 无界面批量运行 (run)
+# ==============================================================================
+# reason: 停止原因，取值见下; instructions: 本次运行执行完的指令条数; pc: 停止时的 PC
+RunResult = namedtuple('RunResult', ['reason', 'instructions', 'pc'])
+
+STOP_HALTED = 'halted'                      # 执行到指令字 0，程序正常结束
+STOP_ERROR = 'error'                        # 执行出错 (error_message 中有详细信息)
+STOP_MAX_INSTRUCTIONS = 'max_instructions'  # 用完指令预算
+STOP_UNTIL_PC = 'until_pc'                  # 到达 until_pc
+STOP_BREAKPOINT = 'breakpoint'              # 到达断点
+STOP_REQUESTED = 'stopped'                  # 后台运行时收到停止命令 (见 SimulationWorker)
+STOP_HISTORY_START = 'history_start'        # 反向运行时回到了撤销日志中最早的状态 (见 run_back)
+
+# 模拟时钟: 每条指令按一个周期计 (CPI = 1)，周期数即 instret；cpu_hz 把周期换算成模拟时间
+DEFAULT_CPU_HZ = 50_000_000
+
+# 空转循环检测: 某个循环头连续判定为非空转时，检查间隔按 2 倍增长，最多每 IDLE_MAX_BACKOFF 次向回跳转检查一次
+IDLE_MAX_BACKOFF = 64
+
+# 计数循环 (见 _analyze_counter_loop): 从 header 开始的一段直线代码，只含可线性表示的运算，最后一条是跳回 header 的分支。
+# branch_pc: 跳回 header 的分支 (或 jal x0) 所在 PC; period: 每圈指令条数;
+# steps: {寄存器: 每圈增量}; fixed: {寄存器: (基准寄存器或 None, 偏移)}，每圈都被赋成同一个值;
+# mnemonic: 分支助记符 ('jal' 表示无条件跳回); operands: 分支两个操作数，表示为这一圈开始时的 (基准寄存器或 None, 偏移)
+CounterLoop = namedtuple('CounterLoop', ['branch_pc', 'period', 'steps', 'fixed', 'mnemonic', 'operands'])
+
+def _counter_loop_iterations(mnemonic, x1, step, k, swapped):
+    """
+    计数循环的分支比较 x 与循环不变量 k (swapped 为 True 时比较 k 与 x)，第 i 圈分支时 x = x1 + (i - 1) * step (模 2^32)。
+    返回从第 1 圈起连续跳回循环头的圈数 (可以偏少，不会偏多)；一直跳回时返回 None
+    """
+    step &= 0xFFFFFFFF
+    step -= (step & 0x80000000) << 1
+    if mnemonic in ('blt', 'bge'): # 有符号比较，在有符号值域中计算
+        x1 -= (x1 & 0x80000000) << 1
+        k -= (k & 0x80000000) << 1
+        lo, hi = -0x80000000, 0x7FFFFFFF
+    else:
+        lo, hi = 0, 0xFFFFFFFF
+    # 统一成 x 与 k' 的关系: 'ne' x != k, 'eq' x == k, 'lt' x < k, 'ge' x >= k
+    relation = {'beq': 'eq', 'bne': 'ne', 'blt': 'lt', 'bltu': 'lt', 'bge': 'ge', 'bgeu': 'ge'}[mnemonic]
+    if swapped and relation == 'lt':
+        relation, k = 'ge', k + 1 # k < x  <=>  x >= k + 1
+    elif swapped and relation == 'ge':
+        relation, k = 'lt', k + 1 # k >= x  <=>  x < k + 1
+    taken = {'eq': x1 == k, 'ne': x1 != k, 'lt': x1 < k, 'ge': x1 >= k}[relation]
+    if not taken:
+        return 0
+    if step == 0:
+        return None
+    if relation == 'ne':
+        # 解同余方程 (i - 1) * step = k - x1 (mod 2^32)，得到第一次相等的圈号 i
+        distance = (k - x1) & 0xFFFFFFFF
+        g = step & -step # gcd(step, 2^32)
+        if distance % g:
+            return None # 永远不会相等
+        modulus = (1 << 32) // g
+        return distance // g * pow(step // g % modulus, -1, modulus) % modulus if modulus > 1 else 0
+    # 在不越过值域边界 (回绕) 的前 length 圈内 x 单调变化，越界之后留给下一次检测重新计算
+    length = (hi - x1) // step + 1 if step > 0 else (x1 - lo) // -step + 1
+    first_exit = None # 第一次不跳回的圈号
+    if relation == 'eq':
+        first_exit = 2
+    elif relation == 'lt' and step > 0:
+        first_exit = (k - x1 + step - 1) // step + 1
+    elif relation == 'ge' and step < 0:
+        first_exit = (x1 - k) // -step + 2
+    if first_exit is not None and first_exit <= length:
+        return first_exit - 1
+    return length
+
+# run_for 每次调用 run() 的指令数范围，实际批大小按耗时自适应
+SLICE_MIN_BATCH = 1000
+SLICE_MAX_BATCH = 1 << 20
+
+# ==============================================================================
+# 内存总线 (页表)
+# 地址空间按 4 KiB 分页: mem_pages 把 ROM/RAM 的页号映射到 (后备 bytearray, 设备起始地址)，
+# 读写时一次字典查找后用 struct 直接按字访问；外设所在的页在 mmio_pages 中映射到
+# MMIORegion 列表，由外设对象自己处理 (见 devices.py)。两张表都查不到的地址是未映射地址。
+# ==============================================================================
+PAGE_SHIFT = 12
+PAGE_SIZE = 1 << PAGE_SHIFT
+
+ROM_BASE = 0x0000_0000
+RAM_BASE = 0x1000_0000
+
+# 外设 device 占用的 [start, end) 地址范围
+MMIORegion = namedtuple('MMIORegion', ['start', 'end', 'device'])
+
+# 完整的机器状态 (见 Simulator32Bit.snapshot/restore)
+# pages: 总线页号 -> 该页 ROM/RAM 内容 (bytes)，前后两份快照之间没有改写过的页共用同一个 bytes 对象;
+# devices: 与 sim.devices 一一对应的 Device.save_state()
+MachineState = namedtuple('MachineState', ['registers', 'pc', 'previous_pc', 'halted', 'error_message',
+                                           'instret', 'ticked_instret', 'pages', 'devices'])
+
+_unpack_u32 = struct.Struct('<I').unpack_from
+_unpack_i32 = struct.Struct('<i').unpack_from
+_unpack_u16 = struct.Struct('<H').unpack_from
+_unpack_i16 = struct.Struct('<h').unpack_from
+_pack_u32 = struct.Struct('<I').pack_into
+_pack_u16 = struct.Struct('<H').pack_into
+
+
+# 32位RISC-V模拟器
+class Simulator32Bit:
+    def __init__(self, io_sink=None, cpu_hz=DEFAULT_CPU_HZ):
+        # 1. 创建物理设备
+        # ROM(flash)为32K, RAM为16K
+        # 为留出余量，我们都使用 64KB (0x10000)
+        self.rom = bytearray(64 * 1024)  # 64KB ROM
+        self.ram = bytearray(64 * 1024)  # 64KB RAM
+
+        self._build_memory_map()
+        self.mem_version = 0 # ROM/RAM 内容每改变一次加 1 (写入相同的值不算)
+        self.dirty_pages = set() # 上一次 snapshot()/restore() 以来改写过的总线页号
+        self._state_pages = None # 上一次 snapshot()/restore() 时各页的内容 (MachineState.pages)
+
+        # 2. 外设 (根据PPT)，UART/GPIO 的输出写入 io_sink 而不是直接打印
+        self.io_sink = io_sink if io_sink is not None else BufferedSink()
+        self.device_version = 0 # 任一外设状态改变时加 1 (见 Device.changed)
+        self.devices = []      # 挂在总线上的全部外设
+        self.tick_devices = [] # 重写了 tick 的外设
+        self.ticked_instret = 0 # 已经通知给 tick_devices 的 instret
+        self.timer = self.attach_device(0x2000_0000, Timer(self.io_sink))
+        self.uart = self.attach_device(0x3000_0000, UART(self.io_sink))
+        self.gpio = self.attach_device(0x4000_0000, GPIO(self.io_sink))
+
+        # 3. 模拟器状态
+        self.registers = [0] * 32  # 32个 32位寄存器
+        self.pc = 0
+        self.previous_pc = 0
+        self.halted = False
+        self.instret = 0 # 复位以来执行完的指令条数，也是模拟时钟的周期数
+        self.block_offset = 0 # 块执行期间正在执行的指令在块内的序号 (只在读内存前更新)
+        self.cpu_hz = cpu_hz
+        self.fast_forward = True # 是否快进空转循环 (见 _skip_idle_iterations)
+        self.pc_to_source_line_map = {} # PC (地址) -> 源代码行号
+        self.symbols = {} # 符号名 -> 地址 (从 ELF 加载时才有)
+        self.decoded_cache = {} # PC -> 译码结果 (见 _decode)
+        self.block_cache = {} # 块起始 PC -> (块函数, 指令条数)，见 _translate_block
+        self.block_pages = {} # 页号 -> 覆盖该页的块起始 PC 集合
+        self.code_modified = False # 执行块期间是否改写了已翻译的代码
+        self.code_pages = set() # 有译码缓存或翻译块的总线页号，只有写这些页时才需要让缓存失效
+        self.loop_cache = {} # 循环头 PC -> CounterLoop，不是计数循环时为 None (见 _analyze_counter_loop)
+        self.dispatch_table = self._build_dispatch_table() # (opcode, funct3, funct7) -> (执行函数, 指令类型)
+        self.slice_batch = SLICE_MIN_BATCH # run_for 当前的批大小
+        self.journal = None # 撤销日志 (journal.ExecutionJournal)，见 enable_journal
+        self.trace = None # 执行轨迹 (tracefile.TraceWriter)，见 start_trace
+
+        self.error_message = None # 添加错误信息变量
+
+        # 4. 初始化状态
+        self.reset()
+
+    def reset(self):
+        # 重置所有寄存器和PC
+        self.registers = [0] * 32
+        self.pc = 0
+        self.previous_pc = 0
+        self.halted = False
+        self.instret = 0
+        self.block_offset = 0
+        self.error_message = None # 重置错误信息
+
+        # 清空 RAM (ROM在加载时被写入，不需要重置)；原地清零，页表中的引用保持有效
+        self.ram[:] = bytes(len(self.ram))
+        self._mark_dirty(RAM_BASE, len(self.ram))
+        self.decoded_cache = {}
+        self.block_cache = {}
+        self.block_pages = {}
+        self.code_pages = set()
+        self.loop_cache = {}
+        if self.journal is not None:
+            self.journal.clear()
+
+        # 清空外设寄存器
+        for device in self.devices:
+            device.reset()
+        self.ticked_instret = 0
+
+        # 根据PPT的链接脚本和启动代码
+        # 栈(sp)在RAM中，并且从上向下增长。
+        # 将sp(x2)设置为RAM的VMA地址 (0x1000_0000)
+        # 加上我们模拟的RAM的物理大小 (64KB)。
+        RAM_VMA_START = 0x10000000
+        RAM_PHYSICAL_SIZE = len(self.ram) # 65536
+        self.set_reg_value(2, RAM_VMA_START + RAM_PHYSICAL_SIZE)
+
+        # self.pc_to_source_line_map 在加载时会重建
+        print("SoC Simulator Reset.")
+    def _build_memory_map(self):
+        """建立页表中 ROM/RAM 的部分: 每一页指向后备缓冲区；外设由 attach_device 加入 mmio_pages"""
+        self.mem_pages = {}
+        for base, buf in ((ROM_BASE, self.rom), (RAM_BASE, self.ram)):
+            for page in range(base >> PAGE_SHIFT, (base + len(buf) + PAGE_SIZE - 1) >> PAGE_SHIFT):
+                self.mem_pages[page] = (buf, base)
+        self.mmio_pages = {}
+
+    def attach_device(self, base, device):
+        """把外设挂到总线的 [base, base + device.size) 上，返回 device"""
+        end = base + device.size
+        pages = range(base >> PAGE_SHIFT, ((end - 1) >> PAGE_SHIFT) + 1)
+        for page in pages:
+            if page in self.mem_pages:
+                raise ValueError(f"外设 {device.name} 的地址范围 0x{base:08X}-0x{end - 1:08X} 与 ROM/RAM 重叠")
+            for region in self.mmio_pages.get(page, ()):
+                if region.start < end and base < region.end:
+                    raise ValueError(f"外设 {device.name} 的地址范围 0x{base:08X}-0x{end - 1:08X} "
+                                     f"与 {region.device.name} 重叠")
+        device.base = base
+        device.bus = self
+        region = MMIORegion(base, end, device)
+        for page in pages:
+            self.mmio_pages.setdefault(page, []).append(region)
+        self.devices.append(device)
+        if type(device).tick is not Device.tick:
+            self.tick_devices.append(device)
+        return device
+
+    def current_cycle(self):
+        """当前正在执行的指令所在的周期 (外设在读写时据此推算自己的状态)"""
+        return self.instret + self.block_offset
+
+    def simulated_seconds(self):
+        return self.instret / self.cpu_hz
+
+    def _next_device_event(self, cycle):
+        """cycle 之后最早的外设事件 (可读状态发生变化) 所在的周期，没有则为 None"""
+        events = [event for event in (device.next_event(cycle) for device in self.devices) if event is not None]
+        return min(events) if events else None
+
+    def _tick_devices(self):
+        # 把上次通知以来执行的指令条数 (每条指令按一个周期计) 交给需要 tick 的外设
+        cycles = self.instret - self.ticked_instret
+        if cycles > 0:
+            self.ticked_instret = self.instret
+            for device in self.tick_devices:
+                device.tick(cycles)
+
+    def mem_read(self, address, num_bytes, signed=False):
+        """
+        从内存总线读取数据。
+        num_bytes 必须是 1, 2, 或 4.
+        """
+        entry = self.mem_pages.get(address >> PAGE_SHIFT)
+        if entry is not None:
+            # 从 ROM 或 RAM 读取
+            buf, base = entry
+            offset = address - base
+            if offset + num_bytes > len(buf):
+                raise MemoryError(f"Read address 0x{address:X} (offset {offset}) out of physical bounds for device")
+            if num_bytes == 4:
+                return (_unpack_i32 if signed else _unpack_u32)(buf, offset)[0]
+            if num_bytes == 1:
+                value = buf[offset]
+                return value - ((value & 0x80) << 1) if signed else value
+            return (_unpack_i16 if signed else _unpack_u16)(buf, offset)[0]
+
+        for region in self.mmio_pages.get(address >> PAGE_SHIFT, ()):
+            if region.start <= address < region.end:
+                return region.device.read(address - region.start, num_bytes, signed)
+
+        raise MemoryError(f"Read from unmapped or invalid address 0x{address:X}")
+
+    def mem_write(self, address, value, num_bytes):
+        """
+        向内存总线写入数据。
+        num_bytes 必须是 1, 2, 或 4.
+        """
+        entry = self.mem_pages.get(address >> PAGE_SHIFT)
+        if entry is not None:
+            # 理论上ROM不可写，但加载程序时需要写入
+            buf, base = entry
+            offset = address - base
+            if offset + num_bytes > len(buf):
+                device_name = "ROM" if buf is self.rom else "RAM"
+                raise MemoryError(f"Write address 0x{address:X} out of physical {device_name} bounds")
+            # 写入与原内容相同时什么都不用做 (也不必让译码缓存失效)
+            if num_bytes == 4:
+                value &= 0xFFFFFFFF
+                if _unpack_u32(buf, offset)[0] == value:
+                    return
+                _pack_u32(buf, offset, value)
+            elif num_bytes == 1:
+                value &= 0xFF
+                if buf[offset] == value:
+                    return
+                buf[offset] = value
+            else:
+                value &= 0xFFFF
+                if _unpack_u16(buf, offset)[0] == value:
+                    return
+                _pack_u16(buf, offset, value)
+            self.mem_version += 1
+            page = address >> PAGE_SHIFT
+            self.dirty_pages.add(page)
+            if (address & (PAGE_SIZE - 1)) > PAGE_SIZE - num_bytes: # 跨页的非对齐访问
+                self.dirty_pages.add(page + 1)
+            code_pages = self.code_pages
+            if code_pages and ((address >> PAGE_SHIFT) in code_pages
+                               or ((address + num_bytes - 1) >> PAGE_SHIFT) in code_pages):
+                self._invalidate_decoded(address, num_bytes)
+            return
+
+        for region in self.mmio_pages.get(address >> PAGE_SHIFT, ()):
+            if region.start <= address < region.end:
+                if region.device.write(address - region.start, value, num_bytes):
+                    return
+                break
+
+        raise MemoryError(f"Write to unmapped or invalid address 0x{address:X}")
+
+    # --------------------------------------------------------------------------
+    # 快照与恢复
+    # 总线记录上一次 snapshot()/restore() 以来改写过的页 (dirty_pages)。snapshot() 只复制这些页，
+    # 其余的页直接沿用上一份快照中的 bytes 对象 (写时复制)；restore() 只写回改写过的页和
+    # 两份快照之间不同的页。复制代价与改写过的页数成正比，与 ROM/RAM 大小无关；
+    # 译码缓存和翻译好的块只在代码所在的页确实变化时才失效。
+    # 同一个固件要从同一个状态反复运行时 (例如换不同的 UART 输入)，
+    # 启动代码执行完后 snapshot() 一次，之后每次 restore() 即可，不必重新加载和复位。
+    # --------------------------------------------------------------------------
+    def _page_bytes(self, page):
+        buf, base = self.mem_pages[page]
+        offset = (page << PAGE_SHIFT) - base
+        return bytes(buf[offset:offset + PAGE_SIZE])
+
+    def snapshot(self):
+        """保存寄存器、PC、ROM/RAM 和外设的状态，返回 MachineState"""
+        if self._state_pages is None:
+            pages = {page: self._page_bytes(page) for page in self.mem_pages}
+        else:
+            pages = dict(self._state_pages)
+            for page in self.dirty_pages:
+                pages[page] = self._page_bytes(page)
+        self.dirty_pages.clear()
+        self._state_pages = pages
+        return MachineState(tuple(self.registers), self.pc, self.previous_pc, self.halted, self.error_message,
+                            self.instret, self.ticked_instret, pages,
+                            tuple(device.save_state() for device in self.devices))
+
+    def restore(self, state, keep_journal=False):
+        """恢复到 snapshot() 返回的状态 (同一个模拟器对象上的任意一份快照)；撤销日志随之清空"""
+        if self.journal is not None and not keep_journal:
+            self.journal.clear()
+        current = self._state_pages
+        changed = set(self.dirty_pages)
+        if current is not state.pages:
+            changed.update(page for page, data in state.pages.items()
+                           if current is None or current.get(page) is not data)
+        for page in changed:
+            buf, base = self.mem_pages[page]
+            offset = (page << PAGE_SHIFT) - base
+            data = state.pages[page]
+            if page in self.code_pages:
+                if buf[offset:offset + PAGE_SIZE] == data:
+                    continue
+                buf[offset:offset + PAGE_SIZE] = data
+                self._invalidate_decoded(page << PAGE_SHIFT, PAGE_SIZE)
+            else:
+                buf[offset:offset + PAGE_SIZE] = data
+        if changed:
+            self.mem_version += 1
+        self.dirty_pages.clear()
+        self._state_pages = state.pages
+
+        self.registers[:] = state.registers
+        self.pc = state.pc
+        self.previous_pc = state.previous_pc
+        self.halted = state.halted
+        self.error_message = state.error_message
+        self.instret = state.instret
+        self.ticked_instret = state.ticked_instret
+        self.block_offset = 0
+        for device, device_state in zip(self.devices, state.devices):
+            device.load_state(device_state)
+        self.device_version += 1
+
+    def get_reg_value(self, reg_idx):
+        if not (0 <= reg_idx <= 31):
+            raise ValueError(f"Invalid register index: {reg_idx}")
+        if reg_idx == 0:
+            return 0 # x0 恒为 0
+        val = self.registers[reg_idx]
+        if val & 0x80000000: # 检查符号位
+            # 如果符号位为1，计算其负数值
+            return val - 0x100000000
+        else:
+            # 否则, 它是一个正数
+            return val
+
+    def set_reg_value(self, reg_idx, value):
+        if not (0 <= reg_idx <= 31):
+            raise ValueError(f"Invalid register index: {reg_idx}")
+        if reg_idx != 0: # x0 恒为 0
+            # 模拟32位
+            self.registers[reg_idx] = value & 0xFFFFFFFF
+
+    def sign_extend(self, value, bits):
+        sign_bit = 1 << (bits - 1)
+        return (value & ((1 << bits) - 1)) - (1 << bits if value & sign_bit else 0)
+
+    def load_program_from_binary_strings(self, binary_codes, source_line_map_list):
+            words = []
+            for code_str in binary_codes:
+                if len(code_str) != 32:
+                    print(f"Warning: Invalid machine code string: {code_str}")
+                    continue
+                words.append(int(code_str, 2))
+            self.load_program(words, source_line_map_list)
+
+    def load_program(self, words, source_line_map_list):
+            # words: 汇编器直接产生的 32 位整数机器码
+            self.reset()
+            self.rom[:] = bytes(len(self.rom)) # 不留下上一个程序的代码
+            self._mark_dirty(ROM_BASE, len(self.rom))
+            try:
+                # 程序从 0x00000000 (ROM) 开始，整段一次复制
+                self.load_bytes(ROM_BASE, words_to_le_bytes(words))
+            except MemoryError as e:
+                print(f"Error loading program at 0x{ROM_BASE:X}: {e}")
+                self.halted = True
+                return
+
+            # 构建 PC (地址) -> 行号的映射
+            self.pc_to_source_line_map = {}
+            for (instr_index, line_num) in source_line_map_list:
+                pc_address = instr_index * 4
+                self.pc_to_source_line_map[pc_address] = line_num
+            self.symbols = {}
+            
+            self.pc = 0
+            self.halted = False
+            print(f"Loaded {len(words)} instructions into ROM.")
+
+    def load_image(self, image):
+        """加载 loader.ProgramImage (.bin/.elf): 各段整块复制到 ROM/RAM，PC 设为入口，记下符号表"""
+        self.reset()
+        self.rom[:] = bytes(len(self.rom))
+        self._mark_dirty(ROM_BASE, len(self.rom))
+        try:
+            for segment in image.segments:
+                self.load_bytes(segment.address, segment.data)
+        except MemoryError as e:
+            print(f"Error loading program: {e}")
+            self.halted = True
+            return
+        self.pc_to_source_line_map = {}
+        self.symbols = dict(image.symbols)
+        self.pc = image.entry
+        self.halted = False
+        total = sum(len(segment.data) for segment in image.segments)
+        print(f"Loaded {total} bytes in {len(image.segments)} segment(s), entry 0x{image.entry:08X}.")
+
+    def _mark_dirty(self, address, num_bytes):
+        self.dirty_pages.update(range(address >> PAGE_SHIFT, ((address + num_bytes - 1) >> PAGE_SHIFT) + 1))
+
+    def load_bytes(self, address, data):
+        """把 data 一次复制到 ROM/RAM 的 [address, address + len(data))，不经过外设；范围必须在同一块存储器内"""
+        entry = self.mem_pages.get(address >> PAGE_SHIFT)
+        if entry is None:
+            raise MemoryError(f"Load to unmapped or invalid address 0x{address:X}")
+        buf, base = entry
+        offset = address - base
+        if offset + len(data) > len(buf):
+            raise MemoryError(f"Image of {len(data)} bytes at 0x{address:X} does not fit in memory")
+        if not data:
+            return
+        buf[offset:offset + len(data)] = data
+        self.mem_version += 1
+        self._mark_dirty(address, len(data))
+        if self.code_pages:
+            self._invalidate_decoded(address, len(data))
+
+    def fetch(self):
+            if self.halted:
+                return None
+            try:
+                instruction_word = self.mem_read(self.pc, 4, signed=False)
+                return instruction_word
+            except MemoryError as e:
+                error_msg = f"PC out of bounds or unmapped: {e}"
+                print(error_msg)
+                self.error_message = error_msg # 保存错误信息
+                self.halted = True
+                return None
+
+    # --------------------------------------------------------------------------
+    # 译码缓存与分派表
+    # 每条指令第一次执行时，按 (opcode, funct3, funct7) 在分派表中查到对应助记符的
+    # 执行函数，并预先提取 rd/rs1/rs2 与符号扩展后的立即数，得到
+    # (执行函数, rd, rs1, rs2, imm, 指令字)，以 PC 为键缓存；之后再执行到同一 PC 时
+    # 只需一次字典查找和一次函数调用。写 ROM/RAM 时 (mem_write) 让被覆盖的字对应的缓存项失效。
+    # 分派表由 assembler.py 的指令表生成 (decode_table)，与汇编器、反汇编器保持一致。
+    # --------------------------------------------------------------------------
+    def _build_dispatch_table(self):
+        table = {}
+        for key, (mnemonic, info) in decode_table().items():
+            table[key] = (getattr(self, '_op_' + mnemonic), info['type'])
+        return table
+
+    def _decode(self, instr_word):
+        if instr_word == 0: # 常见
+            return self._op_halt, 0, 0, 0, 0, instr_word
+
+        opcode = instr_word & 0x7F
+        rd = (instr_word >> 7) & 0x1F
+        funct3 = (instr_word >> 12) & 0x7
+        rs1 = (instr_word >> 15) & 0x1F
+        rs2 = (instr_word >> 20) & 0x1F
+        funct7 = instr_word >> 25
+
+        table = self.dispatch_table
+        entry = (table.get((opcode, funct3, funct7)) or table.get((opcode, funct3, None))
+                 or table.get((opcode, None, None)))
+        if entry is None:
+            return self._op_illegal, rd, rs1, rs2, instr_word, instr_word
+        handler, instr_type = entry
+
+        if instr_type == 'R':
+            imm = 0
+        elif instr_type == 'I-shift':
+            imm = rs2 # shamt 只有 5 位，与 rs2 字段重合
+        elif instr_type in ('I', 'I-load', 'I-jalr'):
+            imm = self.sign_extend(instr_word >> 20, 12)
+        elif instr_type == 'S':
+            imm = self.sign_extend((funct7 << 5) | rd, 12)
+        elif instr_type == 'B':
+            imm_12 = (instr_word >> 31) & 1
+            imm_10_5 = (instr_word >> 25) & 0x3F
+            imm_4_1 = (instr_word >> 8) & 0xF
+            imm_11 = (instr_word >> 7) & 1
+            imm = self.sign_extend((imm_12 << 12) | (imm_11 << 11) | (imm_10_5 << 5) | (imm_4_1 << 1), 13)
+        elif instr_type == 'U':
+            imm = instr_word & 0xFFFFF000 # 立即数在高20位
+        else: # 'J'
+            imm_20 = (instr_word >> 31) & 1
+            imm_10_1 = (instr_word >> 21) & 0x3FF
+            imm_11 = (instr_word >> 20) & 1
+            imm_19_12 = (instr_word >> 12) & 0xFF
+            imm = self.sign_extend((imm_20 << 20) | (imm_19_12 << 12) | (imm_11 << 11) | (imm_10_1 << 1), 21)
+        return handler, rd, rs1, rs2, imm, instr_word
+
+    def _invalidate_decoded(self, address, num_bytes):
+        """address 开始的 num_bytes 字节被改写，丢弃覆盖到的指令字的译码结果和翻译好的块"""
+        cache = self.decoded_cache
+        if cache:
+            for word_address in range(address & ~3, address + num_bytes, 4):
+                cache.pop(word_address, None)
+        block_pages = self.block_pages
+        if block_pages:
+            for page in range(address >> BLOCK_PAGE_SHIFT, ((address + num_bytes - 1) >> BLOCK_PAGE_SHIFT) + 1):
+                starts = block_pages.pop(page, None)
+                if starts:
+                    for start in starts:
+                        self.block_cache.pop(start, None)
+                    self.code_modified = True
+        if self.loop_cache:
+            self.loop_cache.clear()
+
+    # --------------------------------------------------------------------------
+    # 每条指令一个执行函数: (rd, rs1, rs2, imm) -> 下一条指令的 PC
+    # 寄存器以无符号 32 位保存，需要有符号比较时用 v - ((v & 0x80000000) << 1) 转换；
+    # x0 始终保存 0，因此只在 rd != 0 时写回。
+    # --------------------------------------------------------------------------
+    def _op_halt(self, rd, rs1, rs2, imm):
+        print(f"Encountered NOP (0x00000000) at PC={self.pc:08X}. Halting.")
+        self.halted = True
+        return self.pc
+
+    def _op_illegal(self, rd, rs1, rs2, imm):
+        # 未知指令的 imm 字段保存的是完整指令字
+        raise ValueError(f"Unknown instruction: opcode={imm & 0x7F:07b}, funct3={(imm >> 12) & 0x7:03b}, funct7={imm >> 25:07b}")
+
+    # R-type
+    def _op_add(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] + regs[rs2]) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_sub(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] - regs[rs2]) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_sll(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] << (regs[rs2] & 0x1F)) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_slt(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            a, b = regs[rs1], regs[rs2]
+            regs[rd] = 1 if a - ((a & 0x80000000) << 1) < b - ((b & 0x80000000) << 1) else 0
+        return self.pc + 4
+
+    def _op_sltu(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = 1 if regs[rs1] < regs[rs2] else 0
+        return self.pc + 4
+
+    def _op_xor(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = regs[rs1] ^ regs[rs2]
+        return self.pc + 4
+
+    def _op_srl(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = regs[rs1] >> (regs[rs2] & 0x1F)
+        return self.pc + 4
+
+    def _op_sra(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            a = regs[rs1]
+            regs[rd] = ((a - ((a & 0x80000000) << 1)) >> (regs[rs2] & 0x1F)) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_or(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = regs[rs1] | regs[rs2]
+        return self.pc + 4
+
+    def _op_and(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = regs[rs1] & regs[rs2]
+        return self.pc + 4
+
+    # R-type (RV32M Extension)
+    def _op_mul(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] * regs[rs2]) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_mulh(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            a, b = regs[rs1], regs[rs2]
+            regs[rd] = (((a - ((a & 0x80000000) << 1)) * (b - ((b & 0x80000000) << 1))) >> 32) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_mulhsu(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            a = regs[rs1]
+            regs[rd] = (((a - ((a & 0x80000000) << 1)) * regs[rs2]) >> 32) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_mulhu(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] * regs[rs2]) >> 32
+        return self.pc + 4
+
+    def _op_div(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = div32(regs[rs1], regs[rs2])
+        return self.pc + 4
+
+    def _op_divu(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            b = regs[rs2]
+            regs[rd] = regs[rs1] // b if b else 0xFFFFFFFF # 除以0，结果全为1
+        return self.pc + 4
+
+    def _op_rem(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = rem32(regs[rs1], regs[rs2])
+        return self.pc + 4
+
+    def _op_remu(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            b = regs[rs2]
+            regs[rd] = regs[rs1] % b if b else regs[rs1] # 除以0，结果为被除数
+        return self.pc + 4
+
+    # I-type (Arithmetic)
+    def _op_addi(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_slti(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            a = regs[rs1]
+            regs[rd] = 1 if a - ((a & 0x80000000) << 1) < imm else 0
+        return self.pc + 4
+
+    def _op_sltiu(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = 1 if regs[rs1] < (imm & 0xFFFFFFFF) else 0
+        return self.pc + 4
+
+    def _op_xori(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] ^ imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_ori(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] | imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_andi(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = regs[rs1] & imm & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_slli(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = (regs[rs1] << imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_srli(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            regs[rd] = regs[rs1] >> imm
+        return self.pc + 4
+
+    def _op_srai(self, rd, rs1, rs2, imm):
+        if rd:
+            regs = self.registers
+            a = regs[rs1]
+            regs[rd] = ((a - ((a & 0x80000000) << 1)) >> imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    # I-type (Load)；即使 rd 为 x0 也要执行读操作 (可能访问外设或触发错误)
+    def _op_lb(self, rd, rs1, rs2, imm):
+        val = self.mem_read((self.registers[rs1] + imm) & 0xFFFFFFFF, 1, signed=True)
+        if rd:
+            self.registers[rd] = val & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_lh(self, rd, rs1, rs2, imm):
+        val = self.mem_read((self.registers[rs1] + imm) & 0xFFFFFFFF, 2, signed=True)
+        if rd:
+            self.registers[rd] = val & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_lw(self, rd, rs1, rs2, imm):
+        val = self.mem_read((self.registers[rs1] + imm) & 0xFFFFFFFF, 4)
+        if rd:
+            self.registers[rd] = val
+        return self.pc + 4
+
+    def _op_lbu(self, rd, rs1, rs2, imm):
+        val = self.mem_read((self.registers[rs1] + imm) & 0xFFFFFFFF, 1)
+        if rd:
+            self.registers[rd] = val
+        return self.pc + 4
+
+    def _op_lhu(self, rd, rs1, rs2, imm):
+        val = self.mem_read((self.registers[rs1] + imm) & 0xFFFFFFFF, 2)
+        if rd:
+            self.registers[rd] = val
+        return self.pc + 4
+
+    # S-type (Store)
+    def _op_sb(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        self.mem_write((regs[rs1] + imm) & 0xFFFFFFFF, regs[rs2], 1)
+        return self.pc + 4
+
+    def _op_sh(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        self.mem_write((regs[rs1] + imm) & 0xFFFFFFFF, regs[rs2], 2)
+        return self.pc + 4
+
+    def _op_sw(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        self.mem_write((regs[rs1] + imm) & 0xFFFFFFFF, regs[rs2], 4)
+        return self.pc + 4
+
+    # B-type (Branch)
+    def _op_beq(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        if regs[rs1] == regs[rs2]:
+            return (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_bne(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        if regs[rs1] != regs[rs2]:
+            return (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_blt(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        a, b = regs[rs1], regs[rs2]
+        if a - ((a & 0x80000000) << 1) < b - ((b & 0x80000000) << 1):
+            return (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_bge(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        a, b = regs[rs1], regs[rs2]
+        if a - ((a & 0x80000000) << 1) >= b - ((b & 0x80000000) << 1):
+            return (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_bltu(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        if regs[rs1] < regs[rs2]:
+            return (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    def _op_bgeu(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        if regs[rs1] >= regs[rs2]:
+            return (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    # U-type
+    def _op_lui(self, rd, rs1, rs2, imm):
+        if rd:
+            self.registers[rd] = imm
+        return self.pc + 4
+
+    def _op_auipc(self, rd, rs1, rs2, imm):
+        if rd:
+            self.registers[rd] = (self.pc + imm) & 0xFFFFFFFF
+        return self.pc + 4
+
+    # J-type / JALR
+    def _op_jal(self, rd, rs1, rs2, imm):
+        pc = self.pc
+        if rd:
+            self.registers[rd] = (pc + 4) & 0xFFFFFFFF # 存储返回地址
+        return (pc + imm) & 0xFFFFFFFF
+
+    def _op_jalr(self, rd, rs1, rs2, imm):
+        next_pc = (self.registers[rs1] + imm) & 0xFFFFFFFE # 目标地址，最后一位清0
+        if rd:
+            self.registers[rd] = (self.pc + 4) & 0xFFFFFFFF # 存储返回地址
+        return next_pc
+
+    def decode_and_execute(self, instr_word):
+        # 不经过译码缓存，直接执行一条指令字
+        handler, rd, rs1, rs2, imm, _ = self._decode(instr_word)
+        try:
+            self.pc = handler(rd, rs1, rs2, imm)
+        except Exception as e:
+            self._execution_error(e, instr_word)
+
+    def _execution_error(self, e, instr_word):
+        error_msg = f"执行错误: PC=0x{self.pc:08X}, Instr=0x{instr_word:08X}, Error={e}"
+        print(error_msg)
+        self.error_message = error_msg # 存储错误信息
+        import traceback
+        traceback.print_exc()
+        self.halted = True
+
+    def step(self):
+        if self.halted:
+            print("模拟器已停止。")
+            return False
+
+        pc = self.pc
+        previous_pc = self.previous_pc
+        self.previous_pc = pc
+
+        decoded = self.decoded_cache.get(pc)
+        if decoded is None:
+            instruction = self.fetch()
+            if instruction is None or self.halted:
+                self.halted = True
+                print(f"模拟器在 PC=0x{self.pc:08X} 处停止 (PC越界或Fetch失败).")
+                return False
+            decoded = self._decode(instruction)
+            # 只缓存 ROM/RAM 中的普通指令，外设区域的内容随时可能变化；
+            # 停机/未知指令不缓存，保证 run() 的快速路径里不会遇到它们
+            if self._is_code_address(pc) and decoded[0].__name__ not in ('_op_halt', '_op_illegal'):
+                self.decoded_cache[pc] = decoded
+                self.code_pages.add(pc >> PAGE_SHIFT)
+
+        journal = self.journal
+        if journal is not None and not journal.paused:
+            journal.record(self, decoded, previous_pc)
+        trace = self.trace
+        if trace is not None:
+            access = trace.access(self.registers, decoded)
+        handler, rd, rs1, rs2, imm, instr_word = decoded
+        try:
+            self.pc = handler(rd, rs1, rs2, imm)
+        except Exception as e:
+            # 出错的指令没有执行完，previous_pc 仍指向上一条执行完的指令
+            self.previous_pc = previous_pc
+            self._execution_error(e, instr_word)
+
+        if self.halted:
+            return False
+        if trace is not None:
+            trace.retire(pc, decoded, self.registers, access)
+        self.instret += 1
+        if self.tick_devices:
+            self._tick_devices()
+        return True
+
+    # --------------------------------------------------------------------------
+    # 块执行模式 (见文件开头 "基本块翻译")
+    # --------------------------------------------------------------------------
+    def _is_code_address(self, address):
+        return (address < len(self.rom)) or (RAM_BASE <= address < RAM_BASE + len(self.ram))
+
+    def _translate_block(self, start):
+        """从 start 开始翻译一个基本块并加入缓存，返回 (块函数, 指令条数)；无法组成块时返回 None"""
+        body = []
+        used = set()     # 块内读写过的寄存器，进入块时载入局部变量
+        written = set()  # 块内写过的寄存器，离开块时写回
+
+        def reg(idx):
+            if idx == 0:
+                return '0'
+            used.add(idx)
+            return f"r{idx}"
+
+        def write(idx, expr):
+            if idx:
+                used.add(idx)
+                written.add(idx)
+                body.append(f"r{idx} = {expr}")
+
+        pc = start
+        count = 0
+        next_pc = None
+        has_loads = False
+        while next_pc is None and count < BLOCK_MAX_INSTRUCTIONS and self._is_code_address(pc):
+            word = self.mem_read(pc, 4)
+            handler, rd, rs1, rs2, imm, _ = self._decode(word)
+            mnemonic = handler.__name__[len('_op_'):]
+            if mnemonic in ('halt', 'illegal'):
+                break # 留给单步执行处理 (停机或报错)
+
+            if mnemonic in _BLOCK_ALU:
+                write(rd, _BLOCK_ALU[mnemonic](reg(rs1), reg(rs2), imm))
+            elif mnemonic in _BLOCK_LOADS:
+                num_bytes, signed = _BLOCK_LOADS[mnemonic]
+                body.append(f"n = sim.block_offset = {count}") # 外设 (Timer) 据此算出当前周期
+                has_loads = True
+                load = f"mem_read(({reg(rs1)} + {imm}) & 0xFFFFFFFF, {num_bytes}, {signed})"
+                if signed:
+                    load += " & 0xFFFFFFFF"
+                if rd:
+                    write(rd, load)
+                else:
+                    body.append(load) # 即使 rd 为 x0 也要执行读操作
+            elif mnemonic in _BLOCK_STORES:
+                body.append(f"n = {count}")
+                body.append(f"mem_write(({reg(rs1)} + {imm}) & 0xFFFFFFFF, {reg(rs2)}, {_BLOCK_STORES[mnemonic]})")
+                # 写操作改写了已翻译的代码 (自修改代码)，立即结束本块
+                body.append("if sim.code_modified:")
+                body.append("    @WRITEBACK@")
+                body.append(f"    return {pc + 4}, {count + 1}")
+            elif mnemonic in _BLOCK_BRANCHES:
+                cond = _BLOCK_BRANCHES[mnemonic](reg(rs1), reg(rs2))
+                next_pc = f"{(pc + imm) & 0xFFFFFFFF} if {cond} else {pc + 4}"
+            elif mnemonic == 'lui':
+                write(rd, imm)
+            elif mnemonic == 'auipc':
+                write(rd, (pc + imm) & 0xFFFFFFFF)
+            elif mnemonic == 'jal':
+                write(rd, (pc + 4) & 0xFFFFFFFF)
+                next_pc = str((pc + imm) & 0xFFFFFFFF)
+            elif mnemonic == 'jalr':
+                # 先计算目标地址，rd 与 rs1 可能是同一个寄存器
+                body.append(f"target = ({reg(rs1)} + {imm}) & 0xFFFFFFFE")
+                write(rd, (pc + 4) & 0xFFFFFFFF)
+                next_pc = "target"
+            else:
+                break
+            pc += 4
+            count += 1
+
+        if count == 0:
+            return None
+        if next_pc is None:
+            next_pc = str(pc)
+
+        writeback = '; '.join(f"regs[{idx}] = r{idx}" for idx in sorted(written)) or 'pass'
+        if has_loads:
+            writeback += '; sim.block_offset = 0'
+        lines = ["def block(sim, regs, mem_read, mem_write):"]
+        lines += [f"    r{idx} = regs[{idx}]" for idx in sorted(used)]
+        lines += ["    n = 0", "    try:"]
+        lines += ["        " + line.replace('@WRITEBACK@', writeback) for line in body]
+        lines += ["        pass",
+                  "    except BaseException:",
+                  f"        {writeback}",
+                  f"        sim.pc = {start} + 4 * n # 停在出错的指令上",
+                  "        raise",
+                  f"    {writeback}",
+                  f"    return {next_pc}, {count}"]
+        namespace = dict(_BLOCK_NAMESPACE)
+        exec(compile('\n'.join(lines) + '\n', f"<block 0x{start:08X}>", 'exec'), namespace)
+
+        block = (namespace['block'], count)
+        self.block_cache[start] = block
+        for page in range(start >> BLOCK_PAGE_SHIFT, ((pc - 1) >> BLOCK_PAGE_SHIFT) + 1):
+            self.block_pages.setdefault(page, set()).add(start)
+        self.code_pages.update(range(start >> PAGE_SHIFT, ((pc - 1) >> PAGE_SHIFT) + 1))
+        return block
+
+    def step_block(self):
+        """
+        块执行模式: 执行从当前 PC 开始的一整个基本块 (第一次执行时翻译并缓存)。
+        返回实际执行完的指令条数，0 表示模拟器已停止。
+        """
+        if self.halted:
+            return 0
+        pc = self.pc
+        block = self.block_cache.get(pc)
+        if block is None:
+            block = self._translate_block(pc)
+            if block is None:
+                # 指令字为 0、未知指令或不在 ROM/RAM 中: 交给单步执行处理
+                return 1 if self.step() else 0
+
+        self.code_modified = False
+        try:
+            self.pc, count = block[0](self, self.registers, self.mem_read, self.mem_write)
+        except Exception as e:
+            # 块函数已把 PC 和寄存器恢复到出错的那条指令；previous_pc 指向块内最后一条执行完的指令
+            count = (self.pc - pc) // 4
+            if count:
+                self.previous_pc = self.pc - 4
+            self._execution_error(e, self.mem_read(self.pc, 4))
+            self.instret += count
+            return count
+        self.previous_pc = pc + 4 * (count - 1)
+        self.instret += count
+        return count
+
+    def run(self, max_instructions, until_pc=None, breakpoints=frozenset(), blocks=False):
+        """
+        无界面连续运行，最多执行 max_instructions 条指令。
+        执行某条指令之前，若 PC 等于 until_pc 或在 breakpoints 中则停止 (起始 PC 不检查，便于从断点继续)。
+        blocks 为 True 时使用块执行模式；断点所在的块和超出剩余预算的块退回逐条执行，停止位置与逐条执行完全一致。
+        返回 RunResult(停止原因, 本次执行的指令条数, 停止时的 PC)
+        """
+        if self.halted:
+            return RunResult(STOP_ERROR if self.error_message else STOP_HALTED, 0, self.pc)
+
+        stops = set(breakpoints)
+        if until_pc is not None:
+            stops.add(until_pc)
+        # 有停止点时不快进: 被跳过的迭代里可能正好经过断点
+        skip_idle = self.fast_forward and not stops
+        self._idle_saved = None
+        self._idle_backoff = 1
+        if self.trace is not None:
+            executed = self._run_traced(max_instructions, stops)
+        elif self.journal is not None:
+            executed = self._run_checkpointed(max_instructions, stops, blocks, skip_idle)
+        elif blocks:
+            executed = self._run_blocks(max_instructions, stops, skip_idle)
+        else:
+            executed = self._run_steps(max_instructions, stops, skip_idle)
+        if self.tick_devices:
+            self._tick_devices()
+
+        if self.halted:
+            reason = STOP_ERROR if self.error_message else STOP_HALTED
+        elif executed >= max_instructions:
+            reason = STOP_MAX_INSTRUCTIONS
+        elif self.pc == until_pc:
+            reason = STOP_UNTIL_PC
+        else:
+            reason = STOP_BREAKPOINT
+        return RunResult(reason, executed, self.pc)
+
+    def run_for(self, seconds, breakpoints=frozenset(), blocks=True, check_start=False):
+        """
+        按时间片连续运行约 seconds 秒，供 GUI 分帧运行和 SimulationWorker 使用。
+        内部成批调用 run()，并按每批耗时调整批大小 (每批约占时间片的 1/8 ~ 1/2)。
+        run() 不检查起始 PC，所以每批之间由这里补查断点；check_start 为 True 时连第一批的起始 PC 也检查
+        (接续上一个时间片时传 True，从断点处继续运行时传 False)。
+        返回 RunResult，instructions 为本时间片累计执行的指令条数；用完时间片时 reason 为 STOP_MAX_INSTRUCTIONS
+        """
+        deadline = time.perf_counter() + seconds
+        executed = 0
+        while True:
+            if check_start and self.pc in breakpoints and not self.halted:
+                return RunResult(STOP_BREAKPOINT, executed, self.pc)
+            check_start = True
+
+            batch_start = time.perf_counter()
+            result = self.run(self.slice_batch, breakpoints=breakpoints, blocks=blocks)
+            now = time.perf_counter()
+            executed += result.instructions
+            if result.reason != STOP_MAX_INSTRUCTIONS:
+                return result._replace(instructions=executed)
+
+            batch_time = now - batch_start
+            if batch_time < seconds / 8:
+                self.slice_batch = min(self.slice_batch * 2, SLICE_MAX_BATCH)
+            elif batch_time > seconds / 2:
+                self.slice_batch = max(self.slice_batch // 2, SLICE_MIN_BATCH)
+            if now >= deadline:
+                return RunResult(STOP_MAX_INSTRUCTIONS, executed, self.pc)
+
+    def _run_traced(self, max_instructions, stops):
+        # 记录执行轨迹: 与 _run_steps 相同的逐条快速路径 (不使用块执行和快进)，每条指令直接往 trace.buffer 追加一条记录，
+        # 指令中与执行结果无关的部分按 PC 缓存 (TraceWriter.static_info)。
+        # 未缓存的指令以及同时开启了撤销日志时走 step() (step() 自己记录轨迹)。不记录时完全不走这里
+        trace = self.trace
+        cache = self.decoded_cache
+        registers = self.registers
+        use_step = self.journal is not None
+        statics = {} # PC -> (译码结果, TraceWriter.static_info(译码结果))
+        buffer_limit = trace.buffer_limit
+        buffer = trace.buffer
+        executed = 0
+        last_pc = self.previous_pc
+        while executed < max_instructions:
+            pc = self.pc
+            if executed and pc in stops:
+                break
+            decoded = None if use_step else cache.get(pc)
+            if decoded is None:
+                if not self.step():
+                    last_pc = self.previous_pc # 由 step() 设置
+                    break
+                buffer = trace.buffer
+            else:
+                static = statics.get(pc)
+                if static is None or static[0] is not decoded:
+                    static = statics[pc] = (decoded, trace.static_info(decoded))
+                info, written, mem_kind, mask = static[1]
+                handler, rd, rs1, rs2, imm, instr_word = decoded
+                address = value = 0
+                if mem_kind:
+                    address = (registers[rs1] + imm) & 0xFFFFFFFF
+                    value = registers[rs2] & mask
+                try:
+                    self.pc = handler(rd, rs1, rs2, imm)
+                except Exception as e:
+                    self._execution_error(e, instr_word)
+                    break
+                result = registers[written]
+                # 读内存的记录中内存值就是读到 rd 的值
+                buffer.extend((pc, instr_word, info, result, address, result if mem_kind == 1 else value))
+                if len(buffer) >= buffer_limit:
+                    trace.flush()
+                    buffer = trace.buffer
+                self.instret += 1
+            last_pc = pc
+            executed += 1
+        self.previous_pc = last_pc
+        return executed
+
+    def _run_checkpointed(self, max_instructions, stops, blocks, skip_idle):
+        # 开启撤销日志时的连续运行: 仍然使用快速路径，只是每隔 checkpoint_interval 条指令停下来保存一个检查点，
+        # 不逐条记录 (后退时从检查点重新执行，见 ExecutionJournal.step_back)
+        journal = self.journal
+        journal.entries.clear() # 接下来的指令不逐条记录，之前的记录与之后的状态不再衔接
+        # 快速路径遇到未缓存的指令时会退回 step()，这期间 step() 也不能记录，
+        # 否则运行结束后缓冲区里留下运行中途的记录，后退时会跳回那里而不撤销之后的指令
+        journal.paused = True
+        run_chunk = self._run_blocks if blocks else self._run_steps
+        executed = 0
+        try:
+            while executed < max_instructions and not self.halted:
+                if executed and self.pc in stops:
+                    break
+                if journal.checkpoint_due(self.instret):
+                    journal.checkpoint(self)
+                next_checkpoint = journal.checkpoints[-1].instret + journal.checkpoint_interval
+                chunk = min(max_instructions - executed, next_checkpoint - self.instret)
+                self._idle_saved = None
+                done = run_chunk(chunk, stops, skip_idle)
+                executed += done
+                if done < chunk:
+                    break # 停机、出错或到达停止点
+        finally:
+            journal.paused = False
+        return executed
+
+    def _run_steps(self, max_instructions, stops, skip_idle=False):
+        # 快速路径: 直接查译码缓存并调用执行函数，不做逐条的停机检查、打印或 UI 更新；
+        # 停机、出错、未缓存的指令走 step() 慢速路径 (step() 自己维护 instret)。
+        # instret 逐条更新，外设 (Timer) 读到的周期数始终准确
+        cache = self.decoded_cache
+        countdown = 0
+        executed = 0
+        last_pc = self.previous_pc
+        while executed < max_instructions:
+            pc = self.pc
+            if executed and pc in stops:
+                break
+            decoded = cache.get(pc)
+            if decoded is None:
+                if not self.step():
+                    last_pc = self.previous_pc # 由 step() 设置
+                    break
+            else:
+                handler, rd, rs1, rs2, imm, instr_word = decoded
+                try:
+                    self.pc = handler(rd, rs1, rs2, imm)
+                except Exception as e:
+                    self._execution_error(e, instr_word) # 出错的指令不算执行完，last_pc 不变
+                    break
+                self.instret += 1
+            last_pc = pc
+            executed += 1
+            if skip_idle and self.pc <= pc:
+                # 向回跳转 (可能是循环): 见 _idle_check
+                if countdown:
+                    countdown -= 1
+                else:
+                    skipped, countdown = self._idle_check(max_instructions - executed, pc)
+                    executed += skipped
+        self.previous_pc = last_pc
+        return executed
+
+    def _run_blocks(self, max_instructions, stops, skip_idle=False):
+        block_cache = self.block_cache
+        registers, mem_read, mem_write = self.registers, self.mem_read, self.mem_write
+        clear = {} # 块起始 PC -> 块内 (起点之后) 是否没有停止点
+        countdown = 0
+        executed = 0
+        while executed < max_instructions:
+            pc = self.pc
+            if executed and pc in stops:
+                break
+            block = block_cache.get(pc) or self._translate_block(pc)
+            use_block = block is not None and executed + block[1] <= max_instructions
+            if use_block and stops:
+                if pc not in clear:
+                    clear[pc] = stops.isdisjoint(range(pc + 4, pc + 4 * block[1], 4))
+                use_block = clear[pc]
+            if use_block:
+                self.code_modified = False
+                try:
+                    self.pc, count = block[0](self, registers, mem_read, mem_write)
+                except Exception as e:
+                    # 块函数已把 PC 和寄存器恢复到出错的那条指令；previous_pc 指向块内最后一条执行完的指令
+                    count = (self.pc - pc) // 4
+                    self.instret += count
+                    executed += count
+                    if count:
+                        self.previous_pc = self.pc - 4
+                    self._execution_error(e, mem_read(self.pc, 4))
+                    break
+                self.previous_pc = pc + 4 * (count - 1)
+                self.instret += count
+                executed += count
+            # 无法组成块、块内有断点或剩余预算不足: 逐条执行
+            elif not self.step():
+                break
+            else:
+                executed += 1
+            if skip_idle and self.pc <= pc:
+                if countdown:
+                    countdown -= 1
+                else:
+                    skipped, countdown = self._idle_check(max_instructions - executed, self.previous_pc)
+                    executed += skipped
+        return executed
+
+    # --------------------------------------------------------------------------
+    # 执行轨迹 (文件格式见 tracefile.py)
+    # --------------------------------------------------------------------------
+    def start_trace(self, file, compress=False):
+        """开始把每条执行完的指令记录到 file (路径或二进制文件对象)，返回 TraceWriter"""
+        from tracefile import TraceWriter
+        self.stop_trace()
+        self.trace = TraceWriter(file, compress)
+        return self.trace
+
+    def stop_trace(self):
+        """停止记录并写完轨迹文件，返回记录的指令条数 (没有在记录时为 0)"""
+        trace, self.trace = self.trace, None
+        if trace is None:
+            return 0
+        trace.close()
+        return trace.records
+
+    # --------------------------------------------------------------------------
+    # 反向执行 (撤销日志见 journal.py)
+    # --------------------------------------------------------------------------
+    def enable_journal(self, **options):
+        """开启撤销日志，options 为 ExecutionJournal 的参数 (capacity, checkpoint_interval, max_checkpoints)"""
+        from journal import ExecutionJournal
+        self.journal = ExecutionJournal(**options)
+        return self.journal
+
+    def disable_journal(self):
+        self.journal = None
+
+    def step_back(self):
+        """回到上一条指令执行之前的状态；没有开启撤销日志或已经没有更早的历史时返回 False"""
+        return self.journal is not None and self.journal.step_back(self)
+
+    def run_back(self, max_instructions, breakpoints=frozenset()):
+        """
+        反向运行，最多后退 max_instructions 条指令；后退到 PC 在 breakpoints 中时停止 (起始 PC 不检查)。
+        返回 RunResult，停止原因为 STOP_BREAKPOINT、STOP_MAX_INSTRUCTIONS 或 STOP_HISTORY_START
+        """
+        undone = 0
+        while undone < max_instructions:
+            if not self.step_back():
+                return RunResult(STOP_HISTORY_START, undone, self.pc)
+            undone += 1
+            if self.pc in breakpoints:
+                return RunResult(STOP_BREAKPOINT, undone, self.pc)
+        return RunResult(STOP_MAX_INSTRUCTIONS, undone, self.pc)
+
+    # --------------------------------------------------------------------------
+    # 空转循环快进
+    # 运行中遇到向回跳转时，以跳转目标为循环头记下状态 (_loop_state)，下一次向回跳转时比较。
+    # 如果又回到了同一个循环头，并且这一圈之后寄存器没变、ROM/RAM 内容没变、外设状态没变，
+    # 这一圈中也没有外设事件 (如 Timer 计数变化)，那么在下一个外设事件到来之前每一圈都会原样重复:
+    # 程序只是在空等 (例如轮询 Timer 直到某个时刻)。此时直接把 instret (即周期数) 向前推进
+    # 若干整圈，等效于逐条执行了这些指令，寄存器、内存、PC 和外设读到的值都完全一致。
+    # 非空转的循环按指数退避减少检查次数，正常执行几乎没有额外开销。
+    #
+    # 每圈寄存器都在变的计数循环 (如 delay_loop: addi t1,t1,-1; bne t1,zero,delay_loop) 另外处理:
+    # 循环体不访存时，按循环体的线性关系直接算出分支还会连续跳回多少圈，一次性推进计数寄存器和 instret，
+    # 最后退出循环的那一圈仍然正常执行。
+    # --------------------------------------------------------------------------
+    def _loop_state(self):
+        return self.pc, self.registers[:], self.mem_version, self.device_version, self.instret
+
+    def _idle_check(self, budget, branch_pc):
+        """在 branch_pc 处向回跳转之后调用，返回 (快进的指令条数, 下一次检查之前要跳过的向回跳转次数)"""
+        header = self.pc
+        loop = self.loop_cache.get(header, False)
+        if loop is False:
+            loop = self.loop_cache[header] = self._analyze_counter_loop(header)
+        if loop is not None and loop.branch_pc == branch_pc:
+            skipped = self._skip_counter_loop(loop, budget)
+            if skipped:
+                self._idle_saved = None
+                self._idle_backoff = 1
+                return skipped, 0
+        saved = self._idle_saved
+        if saved is None:
+            self._idle_saved = self._loop_state() # 下一次向回跳转时比较
+            return 0, 0
+        self._idle_saved = None
+        skipped = self._skip_idle_iterations(saved, budget)
+        self._idle_backoff = 1 if skipped else min(self._idle_backoff * 2, IDLE_MAX_BACKOFF)
+        return skipped, self._idle_backoff - 1
+
+    def _skip_idle_iterations(self, saved, budget):
+        """saved 为上一次到达循环头时的 _loop_state()，返回快进的指令条数 (不超过 budget)"""
+        header, registers, mem_version, device_version, start = saved
+        end = self.instret
+        period = end - start # 每圈的指令条数
+        if (header != self.pc or period <= 0 or registers != self.registers
+                or mem_version != self.mem_version or device_version != self.device_version):
+            return 0
+        iterations = budget // period
+        event = self._next_device_event(start)
+        if event is not None:
+            if end > event:
+                return 0 # 这一圈中外设状态变了，读到的值可能不同
+            # 被跳过的每一圈读外设的周期都必须早于 event
+            iterations = min(iterations, (event - end) // period)
+        if iterations <= 0:
+            return 0
+        self.instret += iterations * period
+        return iterations * period
+
+    def _analyze_counter_loop(self, header):
+        """
+        从 header 向后符号执行一圈，识别计数循环，返回 CounterLoop；不是计数循环时返回 None。
+        每个寄存器的值表示为 (基准寄存器或 None, 偏移)，即这一圈开始时基准寄存器的值加偏移 (模 2^32)；
+        只接受 addi、有一个操作数是本圈算出的常数的 add/sub、lui、auipc，遇到其他指令 (包括访存) 就放弃
+        """
+        values = {} # 这一圈中写过的寄存器 -> (基准寄存器或 None, 偏移)
+
+        def value(idx):
+            return (None, 0) if idx == 0 else values.get(idx, (idx, 0))
+
+        pc = header
+        for _ in range(BLOCK_MAX_INSTRUCTIONS):
+            if not self._is_code_address(pc):
+                return None
+            self.code_pages.add(pc >> PAGE_SHIFT) # 改写循环体时 _invalidate_decoded 会清空 loop_cache
+            handler, rd, rs1, rs2, imm, _ = self._decode(self.mem_read(pc, 4))
+            mnemonic = handler.__name__[len('_op_'):]
+            if mnemonic in _BLOCK_BRANCHES or (mnemonic == 'jal' and rd == 0):
+                if (pc + imm) & 0xFFFFFFFF != header:
+                    return None
+                break
+            if mnemonic == 'addi':
+                base, offset = value(rs1)
+                result = (base, offset + imm)
+            elif mnemonic == 'add' and (value(rs1)[0] is None or value(rs2)[0] is None):
+                (base1, offset1), (base2, offset2) = value(rs1), value(rs2)
+                result = (base1 if base2 is None else base2, offset1 + offset2)
+            elif mnemonic == 'sub' and value(rs2)[0] is None:
+                base, offset = value(rs1)
+                result = (base, offset - value(rs2)[1])
+            elif mnemonic == 'lui':
+                result = (None, imm)
+            elif mnemonic == 'auipc':
+                result = (None, pc + imm)
+            else:
+                return None
+            if rd:
+                values[rd] = (result[0], result[1] & 0xFFFFFFFF)
+            pc += 4
+        else:
+            return None
+
+        steps, fixed = {}, {}
+        for idx, (base, offset) in values.items():
+            if base == idx:
+                if offset:
+                    steps[idx] = offset
+            elif base is None or base not in values:
+                fixed[idx] = (base, offset) # 每圈都由常数或循环不变量算出同一个值
+            else:
+                return None # 依赖另一个每圈都变的寄存器
+        if mnemonic == 'jal':
+            operands = ()
+        else:
+            operands = (value(rs1), value(rs2))
+            if operands[0][0] in steps and operands[1][0] in steps:
+                return None # 两个操作数都在变
+        return CounterLoop(pc, (pc - header) // 4 + 1, steps, fixed, mnemonic, operands)
+
+    def _skip_counter_loop(self, loop, budget):
+        """当前位于 loop 的循环头，且上一条指令是 loop 的分支；返回快进的指令条数 (不超过 budget)"""
+        registers = self.registers
+
+        def value(base, offset):
+            return ((registers[base] if base else 0) + offset) & 0xFFFFFFFF
+
+        for idx, (base, offset) in loop.fixed.items():
+            if registers[idx] != value(base, offset):
+                return 0 # 不是从循环头完整执行一圈过来的 (例如跳进了循环体中间)
+        if loop.mnemonic == 'jal':
+            iterations = None
+        else:
+            (base1, offset1), (base2, offset2) = loop.operands
+            swapped = base2 in loop.steps
+            if swapped:
+                base1, offset1, base2, offset2 = base2, offset2, base1, offset1
+            iterations = _counter_loop_iterations(loop.mnemonic, value(base1, offset1), loop.steps.get(base1, 0),
+                                                  value(base2, offset2), swapped)
+        limit = budget // loop.period
+        iterations = limit if iterations is None else min(iterations, limit)
+        if iterations <= 0:
+            return 0
+        for idx, step in loop.steps.items():
+            registers[idx] = (registers[idx] + iterations * step) & 0xFFFFFFFF
+        self.instret += iterations * loop.period
+        return iterations * loop.period
+
+
+# ==============================================================================
+# 后台运行 (SimulationWorker)
+# 模拟器在工作线程中按时间片 (run_for) 连续运行，每个时间片结束后把一份不可变的快照放进 snapshots 队列；
+# GUI 线程只读快照，停止和修改断点通过 commands 队列发给工作线程。
+# 运行期间模拟器对象归工作线程所有，收到最后一份快照 (reason 不为 None) 之后才能再直接访问它。
+# ==============================================================================
+SNAPSHOT_PAGE_SIZE = 256 # RAM 按页比较，快照中只带变化过的页
+
+# reason: 运行中为 None，最后一份快照为停止原因 (STOP_*)
+# registers: 32 个寄存器的无符号值; ram_pages: 自上一份快照以来变化过的 RAM 页 ((页号, bytes), ...)，第一份快照带全部页
+# uart_regs: (ctrl, status, baud, txdata, rxdata)
+Snapshot = namedtuple('Snapshot', ['reason', 'pc', 'previous_pc', 'registers', 'instret', 'error_message',
+                                   'ram_pages', 'gpio_leds', 'gpio_smgs', 'uart_regs'])
+
+CMD_STOP = 'stop'               # 参数无意义
+CMD_BREAKPOINTS = 'breakpoints' # 参数为新的断点 PC 集合
+
+
+class SimulationWorker:
+    def __init__(self, simulator, breakpoints=frozenset(), blocks=True, slice_seconds=0.016):
+        self.simulator = simulator
+        self.breakpoints = frozenset(breakpoints)
+        self.blocks = blocks
+        self.slice_seconds = slice_seconds
+        self.snapshots = queue.Queue() # 工作线程 -> GUI
+        self.commands = queue.Queue()  # GUI -> 工作线程，元素为 (CMD_*, 参数)
+        self._ram_shadow = None # 上一份快照发出时的 RAM 内容
+        self._thread = threading.Thread(target=self._loop, name='SimulationWorker', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.commands.put((CMD_STOP, None))
+
+    def set_breakpoints(self, breakpoints):
+        self.commands.put((CMD_BREAKPOINTS, frozenset(breakpoints)))
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _loop(self):
+        sim = self.simulator
+        reason = None
+        check_start = False # 第一个时间片从断点处继续，不检查起始 PC
+        try:
+            while reason is None:
+                while True:
+                    try:
+                        command, arg = self.commands.get_nowait()
+                    except queue.Empty:
+                        break
+                    if command == CMD_STOP:
+                        reason = STOP_REQUESTED
+                    elif command == CMD_BREAKPOINTS:
+                        self.breakpoints = arg
+                if reason is not None:
+                    break
+
+                result = sim.run_for(self.slice_seconds, self.breakpoints, self.blocks, check_start)
+                check_start = True
+                sim.io_sink.flush()
+                if result.reason != STOP_MAX_INSTRUCTIONS:
+                    reason = result.reason
+                # GUI 还没取走上一份快照时先不发，变化的页会累积到下一份
+                elif self.snapshots.empty():
+                    self.snapshots.put(self._snapshot(None))
+        except Exception as e:
+            sim.halted = True
+            sim.error_message = f"后台运行出错: {e}"
+            reason = STOP_ERROR
+        sim.io_sink.flush()
+        self.snapshots.put(self._snapshot(reason))
+
+    def _snapshot(self, reason):
+        sim = self.simulator
+        ram, shadow, size = sim.ram, self._ram_shadow, SNAPSHOT_PAGE_SIZE
+        if shadow is None or len(shadow) != len(ram):
+            shadow = self._ram_shadow = bytearray(len(ram))
+            changed = range(0, len(ram), size)
+        else:
+            changed = [i for i in range(0, len(ram), size) if ram[i:i + size] != shadow[i:i + size]]
+        pages = []
+        for i in changed:
+            data = bytes(ram[i:i + size])
+            shadow[i:i + size] = data
+            pages.append((i // size, data))
+        return Snapshot(reason, sim.pc, sim.previous_pc, tuple(sim.registers), sim.instret, sim.error_message,
+                        tuple(pages), sim.gpio.leds, bytes(sim.gpio.smgs), sim.uart.registers())
+
+
+# ==============================================================================
+# 命令行接口 (无界面运行，供 CI 批量回归使用)
+# 用法: python src/simulator.py program.txt -n 1000000 --blocks --regs
+# ==============================================================================
+def main(argv=None):
+    """命令行入口，返回进程退出码 (执行出错时为 1)"""
+    import argparse
+    from assembler import assemble_text
+    from loader import ImageError, load_image_file
+
+    parser = argparse.ArgumentParser(description='32 位 RISC-V SoC 模拟器 (无界面运行)')
+    parser.add_argument('program', help='汇编源文件，或 GCC 生成的 .bin/.elf 程序映像')
+    parser.add_argument('-n', '--max-instructions', type=int, default=10_000_000, help='最多执行的指令条数')
+    parser.add_argument('--until-pc', help='运行到该地址 (或 ELF 符号) 时停止')
+    parser.add_argument('-b', '--break', dest='breakpoints', action='append',
+                        default=[], help='断点地址 (或 ELF 符号)，可以重复给出')
+    parser.add_argument('--blocks', action='store_true', help='使用块执行模式')
+    parser.add_argument('--regs', action='store_true', help='结束后打印全部寄存器')
+    parser.add_argument('--quiet-io', action='store_true', help='不输出 UART/GPIO 的写操作')
+    parser.add_argument('--cpu-hz', type=int, default=DEFAULT_CPU_HZ, help='模拟的 CPU 时钟频率 (Hz)')
+    parser.add_argument('--no-fast-forward', action='store_true', help='不快进空转循环')
+    parser.add_argument('--trace', help='把执行轨迹 (二进制) 写入该文件，用 python src/tracefile.py 查看')
+    parser.add_argument('--trace-compress', action='store_true', help='用 zlib 压缩执行轨迹')
+    args = parser.parse_args(argv)
+
+    sim = Simulator32Bit(io_sink=NullSink() if args.quiet_io else None, cpu_hz=args.cpu_hz)
+    sim.fast_forward = not args.no_fast_forward
+    if os.path.splitext(args.program)[1].lower() in ('.bin', '.elf'):
+        try:
+            sim.load_image(load_image_file(args.program))
+        except ImageError as e:
+            print(f"错误: {e}")
+            return 2
+    else:
+        with open(args.program, 'r', encoding='utf-8') as f:
+            assembled = assemble_text(f.read())
+        if assembled.errors:
+            print("汇编过程中发现错误:")
+            for e in assembled.errors: print(f"- {e}")
+            return 2
+        sim.load_program(assembled.words, assembled.line_map)
+
+    def address(text):
+        if text in sim.symbols:
+            return sim.symbols[text]
+        try:
+            return int(text, 0)
+        except ValueError:
+            parser.error(f"无法识别的地址或符号: {text}")
+
+    until_pc = address(args.until_pc) if args.until_pc is not None else None
+    if args.trace:
+        sim.start_trace(args.trace, compress=args.trace_compress)
+    start = time.perf_counter()
+    result = sim.run(args.max_instructions, until_pc, {address(text) for text in args.breakpoints}, blocks=args.blocks)
+    elapsed = time.perf_counter() - start
+    sim.io_sink.flush()
+    if args.trace:
+        print(f"执行轨迹: {sim.stop_trace()} 条记录已写入 {args.trace}")
+
+    rate = result.instructions / elapsed if elapsed > 0 else 0
+    print(f"停止原因: {result.reason}, PC=0x{result.pc:08X}, 执行 {result.instructions} 条指令, "
+          f"耗时 {elapsed:.3f} s ({rate:,.0f} 指令/秒), 模拟时间 {sim.simulated_seconds():.3f} s")
+    if sim.error_message:
+        print(sim.error_message)
+    if args.regs:
+        for i in range(0, 32, 4):
+            print('  '.join(f"x{j:<2}=0x{sim.registers[j]:08X}" for j in range(i, i + 4)))
+    return 1 if result.reason == STOP_ERROR else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
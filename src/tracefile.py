@@ -0,0 +1,161 @@
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+
+# ==============================================================================
+# 二进制执行轨迹
+# Simulator32Bit.start_trace() 之后，每条执行完的指令 (出错/停机的指令不算) 记录一条定长记录:
+#
+#   struct '<6I' (24 字节): pc, instr, info, rd_value, mem_address, mem_value
+#   info: 位 0-4 写回的寄存器 rd (0 表示没有写回)，位 8-9 访存类型 (0 无, 1 读, 2 写)，位 12-14 访存字节数
+#
+# 文件开头是一个不压缩的文件头 (TRACE_MAGIC + struct '<HHI': 版本, 记录字节数, 标志)，标志位 0 为 1 时
+# 其后的全部记录是一个 zlib 压缩流。记录先攒在 array 中，满 buffer_records 条后一次写出 (和压缩)。
+# 读取时用 read_trace() 按块流式解压和解码，不会把整个文件读进内存。
+# 用法: python src/tracefile.py trace.bin [条数]   (打印前若干条记录)
+# ==============================================================================
+TRACE_MAGIC = b'RVTRACE\0'
+TRACE_VERSION = 1
+TRACE_FLAG_ZLIB = 1
+
+_HEADER = struct.Struct('<HHI')
+_RECORD = struct.Struct('<6I')
+RECORD_SIZE = _RECORD.size
+READ_CHUNK = 1 << 20
+_ARRAY_TYPE = 'I' if array('I').itemsize == 4 else 'L' # 32 位无符号整数
+
+MEM_NONE, MEM_READ, MEM_WRITE = 0, 1, 2
+
+# rd: 写回的寄存器 (0 表示没有写回); mem_kind: MEM_*; mem_size: 访存字节数
+TraceRecord = namedtuple('TraceRecord', ['pc', 'instr', 'rd', 'rd_value', 'mem_kind', 'mem_size',
+                                         'mem_address', 'mem_value'])
+
+# 执行函数名 -> (是否写回 rd, 访存类型, 字节数)；不在表中的指令只写回 rd
+_LOADS = {'_op_lb': 1, '_op_lh': 2, '_op_lw': 4, '_op_lbu': 1, '_op_lhu': 2}
+_STORES = {'_op_sb': 1, '_op_sh': 2, '_op_sw': 4}
+_BRANCHES = ('_op_beq', '_op_bne', '_op_blt', '_op_bge', '_op_bltu', '_op_bgeu')
+_KINDS = {name: (True, MEM_READ, size) for name, size in _LOADS.items()}
+_KINDS.update({name: (False, MEM_WRITE, size) for name, size in _STORES.items()})
+_KINDS.update({name: (False, MEM_NONE, 0) for name in _BRANCHES})
+_ALU_KIND = (True, MEM_NONE, 0)
+
+
+class TraceWriter:
+    def __init__(self, file, compress=False, buffer_records=65536):
+        """file 为以二进制写模式打开的文件对象或路径 (路径由 close() 负责关闭)"""
+        self._owns_file = isinstance(file, str)
+        self.file = open(file, 'wb') if self._owns_file else file
+        self.compressor = zlib.compressobj(1) if compress else None # 压缩级别 1: 速度优先
+        self.buffer = array(_ARRAY_TYPE)
+        self.buffer_limit = buffer_records * 6
+        self.records = 0
+        self.file.write(TRACE_MAGIC + _HEADER.pack(TRACE_VERSION, RECORD_SIZE, TRACE_FLAG_ZLIB if compress else 0))
+
+    def static_info(self, decoded):
+        """
+        一条指令与执行结果无关的部分: (info 字段, 写回的 rd (没有为 0), 访存类型, 写内存时值的掩码)。
+        Simulator32Bit._run_traced 按 PC 缓存它，在循环中直接往 buffer 追加记录
+        """
+        handler, rd, _, _, _, _ = decoded
+        writes_rd, mem_kind, size = _KINDS.get(handler.__name__, _ALU_KIND)
+        rd = rd if writes_rd else 0
+        return rd | (mem_kind << 8) | (size << 12), rd, mem_kind, (1 << (8 * size)) - 1
+
+    def access(self, registers, decoded):
+        """在执行 decoded 之前调用，返回 retire() 需要的访存信息 (rs1/rs2 可能被这条指令改写)"""
+        handler, _, rs1, rs2, imm, _ = decoded
+        writes_rd, mem_kind, size = _KINDS.get(handler.__name__, _ALU_KIND)
+        if mem_kind == MEM_NONE:
+            return writes_rd, mem_kind, size, 0, 0
+        address = (registers[rs1] + imm) & 0xFFFFFFFF
+        value = registers[rs2] & ((1 << (8 * size)) - 1) if mem_kind == MEM_WRITE else 0
+        return writes_rd, mem_kind, size, address, value
+
+    def retire(self, pc, decoded, registers, access):
+        """指令执行完毕后调用，追加一条记录"""
+        writes_rd, mem_kind, size, address, value = access
+        rd = decoded[1] if writes_rd else 0
+        rd_value = registers[rd]
+        if mem_kind == MEM_READ:
+            value = rd_value
+        buffer = self.buffer
+        buffer.extend((pc, decoded[5], rd | (mem_kind << 8) | (size << 12), rd_value, address, value))
+        if len(buffer) >= self.buffer_limit:
+            self.flush()
+
+    def flush(self):
+        buffer = self.buffer
+        if not buffer:
+            return
+        self.records += len(buffer) // 6
+        if sys.byteorder == 'big':
+            buffer.byteswap()
+        data = buffer.tobytes()
+        self.buffer = array(_ARRAY_TYPE)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.file.write(data)
+
+    def drain(self):
+        """取走尚未写出的记录 (不写到文件中)，返回 array，每 6 个数为一条记录的各字段"""
+        buffer, self.buffer = self.buffer, array(_ARRAY_TYPE)
+        self.records += len(buffer) // 6
+        return buffer
+
+    def close(self):
+        self.flush()
+        if self.compressor is not None:
+            self.file.write(self.compressor.flush())
+            self.compressor = None
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def read_trace(file):
+    """流式读取轨迹文件 (路径或二进制文件对象)，逐条产生 TraceRecord"""
+    f = open(file, 'rb') if isinstance(file, str) else file
+    try:
+        header = f.read(len(TRACE_MAGIC) + _HEADER.size)
+        if header[:len(TRACE_MAGIC)] != TRACE_MAGIC:
+            raise ValueError("不是执行轨迹文件")
+        version, record_size, flags = _HEADER.unpack_from(header, len(TRACE_MAGIC))
+        if version != TRACE_VERSION or record_size != RECORD_SIZE:
+            raise ValueError(f"不支持的轨迹文件版本 {version} (记录 {record_size} 字节)")
+        decompressor = zlib.decompressobj() if flags & TRACE_FLAG_ZLIB else None
+        pending = b''
+        finished = False
+        while not finished:
+            chunk = f.read(READ_CHUNK)
+            finished = not chunk
+            if decompressor is not None:
+                chunk = decompressor.flush() if finished else decompressor.decompress(chunk)
+            data = pending + chunk
+            usable = len(data) - len(data) % RECORD_SIZE
+            for pc, instr, info, rd_value, mem_address, mem_value in _RECORD.iter_unpack(data[:usable]):
+                yield TraceRecord(pc, instr, info & 0x1F, rd_value, (info >> 8) & 0x3, (info >> 12) & 0x7,
+                                  mem_address, mem_value)
+            pending = data[usable:]
+        if pending:
+            raise ValueError("轨迹文件不完整 (最后一条记录被截断)")
+    finally:
+        if f is not file:
+            f.close()
+
+
+if __name__ == '__main__':
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    for index, record in enumerate(read_trace(sys.argv[1])):
+        if index >= limit:
+            break
+        line = f"{record.pc:08X}: {record.instr:08X}"
+        if record.rd:
+            line += f"  x{record.rd} = 0x{record.rd_value:08X}"
+        if record.mem_kind == MEM_READ:
+            line += f"  读 [{record.mem_address:08X}] ({record.mem_size}) = 0x{record.mem_value:X}"
+        elif record.mem_kind == MEM_WRITE:
+            line += f"  写 [{record.mem_address:08X}] ({record.mem_size}) = 0x{record.mem_value:X}"
+        print(line)
@@ -0,0 +1,130 @@
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+import pytest  # noqa: E402
+
+import assembler  # noqa: E402
+
+SOURCE = "start:\n    addi t0, zero, 1\n    beq t0, zero, start\n"
+
+
+def write_sources(directory, names):
+    for name in names:
+        (directory / name).write_text(SOURCE, encoding='utf-8')
+
+
+def test_batch_refuses_to_overwrite_inputs(tmp_path):
+    write_sources(tmp_path, ['a.txt', 'b.s'])
+    with pytest.raises(ValueError):
+        assembler.assemble_batch(str(tmp_path), str(tmp_path))
+    assert (tmp_path / 'a.txt').read_text(encoding='utf-8') == SOURCE
+
+
+def test_cli_refuses_to_overwrite_inputs(tmp_path, capsys):
+    write_sources(tmp_path, ['a.txt'])
+    assert assembler.main([str(tmp_path), '-o', str(tmp_path)]) == 2
+    assert '错误' in capsys.readouterr().out
+    assert (tmp_path / 'a.txt').read_text(encoding='utf-8') == SOURCE
+    # 换成其他格式时输出文件不会覆盖源文件
+    assert assembler.main([str(tmp_path), '-o', str(tmp_path), '-f', 'bin']) == 0
+    assert (tmp_path / 'a.bin').exists()
+    assert (tmp_path / 'a.txt').read_text(encoding='utf-8') == SOURCE
+
+
+DUPLICATE_LABEL = """
+loop:
+    addi t0, t0, 1
+loop:
+    addi t1, t1, 1
+    beq t0, t1, loop
+    jal zero, done
+done:
+    bogus t0
+"""
+
+
+def test_duplicate_label_rejected_in_every_mode():
+    lines = DUPLICATE_LABEL.splitlines(keepends=True)
+    expected = ["第 4 行: 重复定义的标签 'loop' (第 2 行已定义)", "第 9 行: 未知指令 'bogus'"]
+    assert assembler.assemble_lines(lines).errors == expected
+    assert assembler.assemble_lines(lines, one_pass=True).errors == expected
+    assert assembler.assemble_parallel(lines, jobs=1, chunk_lines=3)[1] == expected
+    assert assembler.IncrementalAssembler().assemble(lines)[1] == expected
+
+
+def test_cache_treats_incomplete_metadata_as_miss(tmp_path):
+    cache = assembler.AssemblyCache(str(tmp_path))
+    result = assembler.assemble_text(SOURCE)
+    key = assembler.AssemblyCache.key_for(SOURCE.encode('utf-8'))
+    cache.store(key, result.words, result.symbols, result.line_map)
+    with cache.load(key) as cached:
+        assert list(cached.words) == result.words
+
+    bin_path, meta_path = cache._paths(key)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        f.write('{"version": "%s", "count": %d}' % (assembler.ASSEMBLER_VERSION, len(result.words)))
+    assert cache.load(key) is None
+    os.remove(bin_path) # 映射过的文件已经关闭 (Windows 上未关闭的映射会让删除失败)
+
+
+def test_stats_show_no_instructions_for_failed_files(tmp_path, capsys):
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'good.s').write_text(SOURCE, encoding='utf-8')
+    (tmp_path / 'src' / 'bad.s').write_text(SOURCE + "    bogus t0\n", encoding='utf-8')
+    assert assembler.main([str(tmp_path / 'src'), '-o', str(tmp_path / 'out'), '--stats']) == 1
+    rows = {line.split()[0]: line.split() for line in capsys.readouterr().out.splitlines()
+            if line.startswith(str(tmp_path))}
+    assert rows[str(tmp_path / 'src' / 'bad.s')][2:4] == ['0', '0']
+    assert rows[str(tmp_path / 'src' / 'good.s')][2:4] == ['2', '66'] # txt 格式每条 33 字节
+    assert not (tmp_path / 'out' / 'bad.txt').exists()
+
+
+def _store_repeatedly(cache_dir, rounds):
+    cache = assembler.AssemblyCache(cache_dir)
+    result = assembler.assemble_text(SOURCE)
+    key = assembler.AssemblyCache.key_for(SOURCE.encode('utf-8'))
+    for _ in range(rounds):
+        cache.store(key, result.words, result.symbols, result.line_map)
+
+
+def test_cache_store_is_safe_across_processes(tmp_path):
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        for future in [pool.submit(_store_repeatedly, str(tmp_path), 50) for _ in range(8)]:
+            future.result() # 同一个键并发写入不能抛出异常
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(assembler.TEMP_SUFFIX)]
+    key = assembler.AssemblyCache.key_for(SOURCE.encode('utf-8'))
+    with assembler.AssemblyCache(str(tmp_path)).load(key) as cached:
+        assert list(cached.words) == assembler.assemble_text(SOURCE).words
+
+
+def test_cache_write_failure_does_not_fail_assembly(tmp_path, monkeypatch):
+    def full_disk(*args):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(assembler.AssemblyCache, 'store', full_disk)
+    (tmp_path / 'a.s').write_text(SOURCE, encoding='utf-8')
+    count, errors = assembler.assemble_file(str(tmp_path / 'a.s'), str(tmp_path / 'a.bin'),
+                                            cache_dir=str(tmp_path / 'cache'))
+    assert (count, errors) == (2, [])
+    assert (tmp_path / 'a.bin').read_bytes() == assembler.format_raw_binary(assembler.assemble_text(SOURCE).words)
+
+
+def test_evict_removes_stale_temp_files(tmp_path):
+    stale = tmp_path / ('old' + assembler.TEMP_SUFFIX)
+    fresh = tmp_path / ('new' + assembler.TEMP_SUFFIX)
+    stale.write_bytes(b'x')
+    fresh.write_bytes(b'x')
+    old = stale.stat().st_mtime - assembler.STALE_TEMP_SECONDS - 1
+    os.utime(stale, (old, old))
+    assembler.AssemblyCache(str(tmp_path))._evict()
+    assert not stale.exists() and fresh.exists()
+
+
+def test_stream_rejects_cache_dir(tmp_path, capsys):
+    (tmp_path / 'a.s').write_text(SOURCE, encoding='utf-8')
+    assembler.assemble(str(tmp_path / 'a.s'), str(tmp_path / 'a.txt'), stream=True, cache_dir=str(tmp_path / 'c'))
+    assert '错误' in capsys.readouterr().out
+    assert not (tmp_path / 'a.txt').exists()
@@ -0,0 +1,131 @@
+import contextlib
+import io
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from assembler import assemble_text  # noqa: E402
+from devices import BufferedSink, NullSink  # noqa: E402
+from simulator import Simulator32Bit  # noqa: E402
+
+# 访存、调用和计数循环都有，run() 中会有未缓存的指令退回 step()
+PROGRAM = """
+    lui s0, 0x10000
+    addi s1, zero, 0
+loop:
+    addi s1, s1, 1
+    sw s1, 0(s0)
+    lw t0, 0(s0)
+    add t1, t1, t0
+    jal ra, func
+    addi t2, zero, 3
+delay:
+    addi t2, t2, -1
+    bne t2, zero, delay
+    jal zero, loop
+func:
+    sb t1, 4(s0)
+    jalr zero, 0(ra)
+"""
+
+
+# 不断向 UART 发送递增的字节，并把计数写到 GPIO
+UART_PROGRAM = """
+    lui s0, 0x30000
+    lui s1, 0x40000
+    addi t0, zero, 0
+loop:
+    addi t0, t0, 1
+    sw t0, 12(s0)
+    sb t0, 0(s1)
+    jal zero, loop
+"""
+
+
+def make_sim(source=PROGRAM, io_sink=None):
+    assembled = assemble_text(source)
+    assert not assembled.errors
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = Simulator32Bit(io_sink=io_sink if io_sink is not None else NullSink())
+        sim.load_program(assembled.words, assembled.line_map)
+    return sim
+
+
+def machine_state(sim):
+    return (tuple(sim.registers), sim.pc, sim.previous_pc, sim.instret, sim.halted,
+            bytes(sim.rom), bytes(sim.ram), tuple(_device_state(device) for device in sim.devices))
+
+
+def _device_state(device):
+    # version 只是变化计数 (撤销也算一次变化)，不属于外设的可见状态
+    return repr({key: value for key, value in device.save_state().items() if key != 'version'})
+
+
+def stepped(count):
+    sim = make_sim()
+    for _ in range(count):
+        assert sim.step()
+    return sim
+
+
+def test_step_back_after_run_matches_stepping():
+    for blocks in (False, True):
+        sim = make_sim()
+        sim.enable_journal(checkpoint_interval=100)
+        for _ in range(3):
+            assert sim.step()
+        sim.run(1000, blocks=blocks)
+        assert sim.instret == 1003
+        assert machine_state(sim) == machine_state(stepped(1003))
+
+        assert sim.step_back()
+        assert machine_state(sim) == machine_state(stepped(1002))
+        assert sim.step_back()
+        assert machine_state(sim) == machine_state(stepped(1001))
+
+
+def test_step_back_after_stepping_and_running_twice():
+    sim = make_sim()
+    sim.enable_journal(checkpoint_interval=64)
+    sim.run(500)
+    for _ in range(5):
+        assert sim.step()
+    sim.run(300)
+    for expected in range(804, 790, -1):
+        assert sim.step_back()
+        assert machine_state(sim) == machine_state(stepped(expected))
+
+
+def test_step_back_past_buffer_emits_no_device_output():
+    sink = BufferedSink(capacity=1 << 20)
+    sim = make_sim(UART_PROGRAM, sink)
+    sim.enable_journal(capacity=8, checkpoint_interval=50)
+    for _ in range(120):
+        assert sim.step()
+    emitted = len(sink.lines)
+    for expected in range(119, 99, -1):
+        assert sim.step_back()
+        reference = make_sim(UART_PROGRAM)
+        for _ in range(expected):
+            reference.step()
+        assert machine_state(sim) == machine_state(reference)
+        assert bytes(sim.uart.tx_bytes) == bytes(reference.uart.tx_bytes)
+    assert len(sink.lines) == emitted # 后退时不会重新发出已经输出过的内容
+
+
+def test_uart_undo_entries_do_not_copy_sent_bytes():
+    sim = make_sim(UART_PROGRAM)
+    journal = sim.enable_journal(capacity=1000)
+    for _ in range(2000):
+        assert sim.step()
+    stores = [entry.store for entry in journal.entries
+              if entry.store is not None and entry.store[1] is sim.uart]
+    assert stores
+    # 每条记录只保存寄存器和已发送的字节数，与运行了多久无关
+    assert all(len(state) == 4 and isinstance(state[3], int) for _, _, state in stores)
+    sent = len(sim.uart.tx_bytes)
+    for _ in range(8):
+        assert sim.step_back()
+    assert len(sim.uart.tx_bytes) == sent - 2
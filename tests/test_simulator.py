@@ -0,0 +1,59 @@
+import contextlib
+import io
+import os
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from assembler import assemble_text  # noqa: E402
+from devices import NullSink  # noqa: E402
+from simulator import STOP_ERROR, Simulator32Bit  # noqa: E402
+
+# 第一个程序在块中间出错，第二个在块的第一条指令出错 (lui t2, 0x80000 之后的地址没有映射)
+FAULT_MID_BLOCK = """
+    addi t0, zero, 1
+    addi t1, zero, 2
+    lui t2, 0x80000
+    lw a0, 0(t2)
+    addi a1, zero, 3
+"""
+FAULT_BLOCK_START = """
+    lui t2, 0x80000
+    jal zero, target
+    addi a1, zero, 3
+target:
+    sw t0, 0(t2)
+"""
+
+
+def make_sim(source):
+    assembled = assemble_text(source)
+    assert not assembled.errors
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = Simulator32Bit(io_sink=NullSink())
+        sim.load_program(assembled.words, assembled.line_map)
+    return sim
+
+
+def final_state(source, mode):
+    sim = make_sim(source)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        if mode == 'step':
+            while sim.step():
+                pass
+        elif mode == 'step_block':
+            while sim.step_block():
+                pass
+        else:
+            assert sim.run(100, blocks=(mode == 'blocks')).reason == STOP_ERROR
+    return sim.pc, sim.previous_pc, sim.instret, tuple(sim.registers)
+
+
+def test_fault_leaves_previous_pc_at_last_retired_instruction():
+    for source, fault_pc in ((FAULT_MID_BLOCK, 0x0C), (FAULT_BLOCK_START, 0x0C)):
+        expected = final_state(source, 'step')
+        assert expected[0] == fault_pc
+        assert expected[1] == {FAULT_MID_BLOCK: 0x08, FAULT_BLOCK_START: 0x04}[source]
+        for mode in ('run', 'blocks', 'step_block'):
+            assert final_state(source, mode) == expected, mode